@@ -0,0 +1,126 @@
+# timing benchmark for find_hkl: one reference structure per space group, end-to-end
+# Pattern() plus each stage of it, at hmax = kmax = lmax = 5, 10, 20, 40 (box enumeration).
+# the stage times are the ones pattern_stats() records inside the real pattern_data() with
+# cfg.instrument on, so they follow whatever the library does. runs headless (no plots, no
+# cache, nothing written to ./output), appends the timings to a history file
+# (benchmark-history.json in the current directory by default) and exits with 1 if any
+# stage got slower than the history by more than --threshold
+#
+# python benchmark.py                       all cases, all hmax
+# python benchmark.py --cases SG225 --hmax 5 10 --repeat 5
+# python benchmark.py --no-save             just compare, don't add this run to the history
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,here)
+import find_hkl
+from find_hkl import Co, Fe, Ge, Ti
+
+# reference structures: settings for each, and the atoms X1 X2 Y1 Y2 Z1 Z2 on its sites
+cases = {
+	"SG225": (dict(space_group="SG225",A=5.75),	#L21 Co2FeGe
+		lambda S: [[Co,S.c8,0.5],[Co,S.c8,0.5],[Fe,S.a4,0.5],[Fe,S.a4,0.5],[Ge,S.b4,0.5],[Ge,S.b4,0.5]]),
+	"SG216": (dict(space_group="SG216",A=5.80),	#C1b CoTiGe
+		lambda S: [[Co,S.c4,1.0],[Co,S.d4,0],[Ti,S.a4,1.0],[Ti,S.a4,0],[Ge,S.b4,1.0],[Ge,S.b4,0]]),
+	"SG224": (dict(space_group="SG224",A=4.30),
+		lambda S: [[Fe,S.a2,1.0],[Fe,S.a2,0],[Co,S.b4,1.0],[Co,S.b4,0],[Ge,S.d6,1.0],[Ge,S.d6,0]]),
+	"SG194": (dict(space_group="SG194",A=5.10,C=4.10,x=0.8333),	#DO19 Co3Ge
+		lambda S: [[Co,S.h6,1.0],[Co,S.h6,0],[Ge,S.c2,1.0],[Ge,S.c2,0],[Ge,S.c2,0],[Ge,S.c2,0]]),
+	"SG139": (dict(space_group="SG139",A=3.80,C=7.10),	#DO22 Fe2CoGe-like
+		lambda S: [[Fe,S.d4,1.0],[Fe,S.d4,0],[Co,S.b2,1.0],[Co,S.b2,0],[Ge,S.a2,1.0],[Ge,S.a2,0]]),
+	"SG46": (dict(space_group="SG46",A=6.00,B=10.97,C=6.37,x=0.5295,y=0.1236,z=0.0),	#FeTiSi type, Jeitschko x, y for 8c
+		lambda S: [[Fe,S.c8,1.0],[Fe,S.a4,1.0],[Ti,S.b4,1.0],[Ti,S.b4,0],[Ge,S.c8,0],[Ge,S.c8,0]]),
+	}
+
+stages = ["enumeration","rules","d/2theta","F_hkl","f","LP/G","sort","normalize","CSV output","Pattern"]
+
+def best_of(repeat,job):	#fastest of repeat runs, seconds
+	times = []
+	for i in range(repeat):
+		t = time.perf_counter()
+		job()
+		times.append(time.perf_counter()-t)
+	return(min(times))
+
+def time_stages(cfg,named,repeat):	#stage times from pattern_stats() of the real pattern_data(), fastest of repeat runs
+	out = {}
+	traced = cfg.replace(instrument=1)
+	for i in range(repeat):
+		find_hkl.f_cache.clear()		#time working f out, not the cache lookup
+		stats = find_hkl.reset_stats()
+		result = find_hkl.pattern_data(traced,*named)
+		for name,st in stats["stages"].items():
+			if (name in stages):
+				out[name] = min(out.get(name,st["time"]),st["time"])
+	pattern,pattern_dict2 = result[:2]
+	with tempfile.TemporaryDirectory() as tmp:	#keep the CSVs out of the tree
+		csv_cfg = cfg.replace(output_dir=tmp)
+		out["CSV output"] = best_of(repeat,lambda: (find_hkl.write_reflections(csv_cfg,*(named+[pattern])),
+			find_hkl.write_peak_list(csv_cfg,*(named+[pattern_dict2]))))
+	out["Pattern"] = best_of(repeat,lambda: find_hkl.Pattern(cfg,*(named+[0,0,0])))
+	out["reflections"] = stats["counts"].get("reflections",0)
+	return(out)
+
+def regressions(history,results,threshold,floor,window):	#stages slower than the recent history
+	slow = []
+	for case in results:
+		for h in results[case]:
+			for stage in stages:
+				past = [run["results"][case][h][stage] for run in history[-window:]
+					if case in run["results"] and h in run["results"][case] and stage in run["results"][case][h]]
+				if (len(past)==0):
+					continue
+				ref = float(np.median(past))
+				now = results[case][h][stage]
+				if (now>ref*(1.0+threshold) and now-ref>floor):
+					slow.append((case,h,stage,ref,now))
+	return(slow)
+
+def main():
+	parser = argparse.ArgumentParser(description="time Pattern() and its stages for each space group")
+	parser.add_argument("--cases",nargs="+",default=list(cases),choices=list(cases))
+	parser.add_argument("--hmax",nargs="+",type=int,default=[5,10,20,40])
+	parser.add_argument("--repeat",type=int,default=5,help="best of this many runs per timing")
+	parser.add_argument("--history",default="benchmark-history.json",help="in the current directory unless a path is given")
+	parser.add_argument("--threshold",type=float,default=0.25,help="fail if a stage is this fraction slower")
+	parser.add_argument("--floor",type=float,default=0.005,help="ignore slowdowns smaller than this, seconds")
+	parser.add_argument("--window",type=int,default=5,help="compare against the median of this many past runs")
+	parser.add_argument("--no-save",action="store_true",help="don't add this run to the history")
+	args = parser.parse_args()
+
+	results = {}
+	for case in args.cases:
+		results[case] = {}
+		for h in args.hmax:
+			changes,atoms = cases[case]
+			cfg = find_hkl.settings(hmax=h,kmax=h,lmax=h,**changes)	#defaults: no output, no cache
+			results[case][str(h)] = time_stages(cfg,atoms(find_hkl.wyckoff_sites(cfg)),args.repeat)
+			t = results[case][str(h)]
+			print("%-6s hmax=%-3d %6d hkl  "%(case,h,t["reflections"])+"  ".join(["%s %.4f"%(s,t[s]) for s in stages]))
+			sys.stdout.flush()
+
+	history = []
+	if (os.path.exists(args.history)):
+		history = json.load(open(args.history))
+	slow = regressions(history,results,args.threshold,args.floor,args.window)
+	if (not args.no_save):
+		history.append({"time": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+			"numpy": np.__version__, "machine": platform.node(), "results": results})
+		with open(args.history,"w") as fh:
+			json.dump(history,fh,indent=1)
+	for case,h,stage,ref,now in slow:
+		print("!!! %s hmax=%s %s: %.4f s, was %.4f s"%(case,h,stage,now,ref))
+	if (slow):
+		sys.exit(1)
+
+if __name__=="__main__":
+	main()
@@ -0,0 +1,2332 @@
+# XRD pattern calculation for Heusler alloys and related materials
+# Copyright (C) 2018-2025  Patrick R. LeClair
+# this version should work with python 3
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# the calculation itself, as a module you can import. importing it does nothing: no
+# printing, no tables built, no matplotlib (that is only loaded when a plot is asked for).
+# everything a calculation depends on (space group, lattice, x-rays, corrections, output
+# options) is in a settings object that is passed to each call, e.g.
+#
+#	from find_hkl import *
+#	cfg = settings(space_group="SG216", A=5.80)
+#	Sites = wyckoff_sites(cfg)
+#	Pattern(cfg,[Co,Sites.c4,1.0],[Co,Sites.d4,0],[Ti,Sites.a4,1.0],[Ti,Sites.a4,0],[Ge,Sites.b4,1.0],[Ge,Sites.b4,0],0,0,0)
+#
+# find_hkl-3_11.py is the script version, with the blocks you edit
+
+import csv
+import os
+import hashlib
+import json
+import time
+import tracemalloc
+import threading
+import re
+import warnings
+import multiprocessing
+from collections import OrderedDict
+from fractions import Fraction
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from numpy import *
+import numpy as np
+
+#class so we can do things like Site.a2, Site.h6, etc
+class positions:
+	pass
+
+#specimen types to adjust lorentz-polarization factor
+POWDER = 0
+SINGLE_XTAL = 1
+
+#Ka average, Ka1, Ka2, Kb1 in Angstroms for each x-ray tube. anything else gets Cu
+wavelengths = {
+	"Co": (1.79026,1.788965,1.792850,1.620790),
+	"Cu": (1.54184,1.540562,1.544390,1.392218),
+	}
+
+def tube_lines(XRAY,ka2=0.5,kb=0.0):	#[tube, wavelength, weight] for PatternLines, Ka1 = 1
+	Ka1,Ka2,Kb = wavelengths.get(XRAY,wavelengths["Cu"])[1:4]
+	lines = [[XRAY,Ka1,1.0]]
+	if (ka2>0):
+		lines.append([XRAY,Ka2,ka2])
+	if (kb>0):			#only if there is no filter or monochromator
+		lines.append([XRAY,Kb,kb])
+	return(lines)
+
+# everything a calculation depends on. the class attributes are the defaults, and
+# settings(space_group="SG46",A=6.0,...) changes them for one object. a settings object
+# can't be changed once made, cfg.replace(A=5.9) gives a new one, so a calculation
+# running in one thread never sees another thread change its structure. misspelled
+# names are an error rather than silently ignored
+
+class settings:
+	#structure
+	space_group = "SG225"	#SG46 SG224, SG216, SG194, SG139, SG221, SG123, SG229 (space_groups below)
+	A = 6.00				#lattice constants, angstroms
+	B = 10.97
+	C = 6.37
+	x = 0.0					#x,y,z parameters for sites that have them
+	y = 1.0/6
+	z = 0.12
+
+	#wavelength and corrections
+	XRAY = "Cu"				# "Co" or "Cu"
+	DISPERSION = 1			#include f' and f" dispersion corrections to atomic scattering factor?
+	DEBYE_WALLER = 1		#include debye-waller correction or no
+	SAMPLE_TYPE = SINGLE_XTAL	# POWDER or SINGLE_XTAL, to determine Lorentz-polarization
+	FILM = 1
+	THICKNESS = 19.5e-7		#in cm
+	MU = 3031				#in 1/cm, for thickness corr.
+	AUTO_MU = 0				#1 = work MU out from the atoms on the sites instead (absorption_mu)
+
+	#calculation ranges
+	hmax = kmax = lmax = 0	#0 = every hkl with 2theta < THETA_MAX (limiting sphere)
+	THETA_MAX = 120
+	THETA_MIN = 5
+	SYMMETRY_REDUCE = 1		#compute one hkl per family of equivalent reflections, scale by multiplicity
+
+	#output, see the script for what each one does
+	output_dir = "./output"
+	plotfile = 0
+	plotsqrt = 0
+	outputlist = 0
+	outputlistverbose = 0
+	profile = 0
+	profile_step = 0.01
+	profile_U = 0.004
+	profile_V = -0.002
+	profile_W = 0.003
+	profile_eta = 0.5
+	profile_ka2 = 0.5
+	profile_window = 15
+	profile_background = 0.0
+	merge_tol = 1e-6		#reflections closer than this in 2theta (degrees) are one peak
+	merge_dtol = 0.0		#or closer than this in d, as a fraction of d
+	merge_fwhm = 0.0		#or closer than this fraction of the profile FWHM there (profile_U, V, W)
+	pattern_cache = 0
+	pattern_cache_dir = "./cache"
+	pattern_cache_mb = 200
+	element_cache_dir = ""	#save the element table here as .npy for later runs to memory-map, "" = memory only
+	instrument = 0
+	instrument_json = ""
+
+	#searches
+	search_xyz_points = 21
+	search_xyz_rounds = 3
+	search_step = 1.0
+	search_tol = 0.3
+	search_max = 100000
+	search_cutoff = 0.0
+	search_workers = 0
+	search_show = 10
+
+	#reciprocal space maps
+	rsm_coherence = 500.0	#lateral coherence length, angstroms
+	rsm_mosaic = 0.2		#mosaic spread FWHM, degrees
+	rsm_mb = 256			#memory for each chunk of the map, MB
+
+	#texture
+	texture_mb = 256		#memory for each chunk of orientations x reflections x directions, MB
+
+	def __init__(self,**changes):
+		for name,value in changes.items():
+			if (not hasattr(settings,name) or callable(getattr(settings,name))):
+				raise AttributeError("no setting called %s"%(name))
+			object.__setattr__(self,name,value)
+
+	def __setattr__(self,name,value):
+		raise AttributeError("settings can't be changed, use cfg.replace(%s=...)"%(name))
+
+	def __delattr__(self,name):
+		raise AttributeError("settings can't be changed, use cfg.replace(%s=...)"%(name))
+
+	def replace(self,**changes):	#a copy with these changed
+		new = dict(self.__dict__)
+		new.update(changes)
+		return(settings(**new))
+
+	@property
+	def Lambda(self):
+		return(wavelengths.get(self.XRAY,wavelengths["Cu"])[0])
+
+	@property
+	def Lambda1(self):		#Ka1, Ka2 for the profile
+		return(wavelengths.get(self.XRAY,wavelengths["Cu"])[1])
+
+	@property
+	def Lambda2(self):
+		return(wavelengths.get(self.XRAY,wavelengths["Cu"])[2])
+
+def print_settings(cfg):	#the banner the script prints before it starts
+	if (cfg.SAMPLE_TYPE == POWDER):
+		print("Powder Lorentz-polarization correction")
+	elif (cfg.SAMPLE_TYPE == SINGLE_XTAL):
+		print("Single crystal Lorentz-polarization correction")
+
+	if (cfg.DISPERSION):
+		print("Dispersion corrections to atomic scattering factor f' and f'' included")
+	else:
+		print("Dispersion corrections to atomic scattering factor f' and f'' NOT included")
+
+	if (cfg.DEBYE_WALLER):
+		print("Debye-Waller corrections included")
+	else:
+		print("Debye-Waller corrections NOT included")
+
+	if (cfg.FILM):
+		if (cfg.AUTO_MU):
+			print("Thin film: thickness correction applied, t=%s cm, mu from the composition"%(cfg.THICKNESS))
+		else:
+			print("Thin film: thickness correction applied, t=%s cm, mu=%s 1/cm"%(cfg.THICKNESS,cfg.MU))
+	else:
+		print("Bulk assumed, no thickness correction")
+
+	if (cfg.XRAY=="Co"):
+		print("Co Ka")
+	elif (cfg.XRAY=="Cu"):
+		print("Cu Ka")
+	else:
+		print("No X-ray wavelength specified, defaulting to Cu Ka.")
+
+	if (cfg.hmax>0):
+		print("hkl up to +/-(%d,%d,%d)"%(cfg.hmax,cfg.kmax,cfg.lmax))
+	else:
+		print("all hkl with 2theta < %s"%(cfg.THETA_MAX))
+
+	print("%s structure"%(cfg.space_group))
+	print("a lattice parameter %s A"%(cfg.A))
+	if ("B" in lattices[lattice(cfg)]):
+		print("b lattice parameter %s A"%(cfg.B))
+	if ("C" in lattices[lattice(cfg)]):
+		print("c lattice parameter %s A"%(cfg.C))
+
+# space groups as data, so a new one is an entry here rather than edits all through the code
+#  lattice: which of A, B, C the axes are and the angle between a and b (lattices below)
+#  laue: Laue class, for SYMMETRY_REDUCE. acentric: no inversion center
+#  symops: generators of the space group as x,y,z triplets, centering: its centering translations.
+#     the reflection conditions come from these (derived_rules), and which hkl a site can't
+#     contribute to from exact phases (F_hkl)
+#  sites: one representative position of each Wyckoff site, the rest of the orbit comes from
+#     symops (wyckoff_orbit). naming convention: wycoff letter + multiplicity b/c we can't use
+#     names like Site.2a. x, y, z in a position are the free parameters cfg.x, y, z
+#  swaps: site swaps (origin shifts, inversion) that leave the space group alone, for SearchSites
+
+lattices = {		#axes and cos(gamma), alpha = beta = 90
+	"cubic": ("A","A","A",0.0),
+	"tetragonal": ("A","A","C",0.0),
+	"hexagonal": ("A","A","C",-0.5),
+	"orthorhombic": ("A","B","C",0.0),
+	}
+
+m3m = ["-x,-y,z", "-x,y,-z", "z,x,y", "y,x,-z", "-x,-y,-z"]	#generators of m-3m and 4/mmm
+i4mmm = ["-x,-y,z", "-y,x,z", "-x,y,-z", "-x,-y,-z"]
+F_centering = ["0,1/2,1/2", "1/2,0,1/2", "1/2,1/2,0"]
+I_centering = ["1/2,1/2,1/2"]
+
+space_groups = {
+	"SG225": {"lattice": "cubic", "laue": "m-3m", "acentric": False, "heusler": True,	#L21
+		"symops": m3m, "centering": F_centering,
+		"sites": {'a4': "0,0,0", 'b4': "1/2,1/2,1/2", 'c8': "1/4,1/4,1/4", 'd24': "0,1/4,1/4"},
+		"swaps": [{'a4':'b4','b4':'a4'}]},
+	"SG216": {"lattice": "cubic", "laue": "m-3m", "acentric": True, "heusler": True,	#Xa, C1b. same rules as 225
+		"symops": ["-x,-y,z", "-x,y,-z", "z,x,y", "y,x,z"], "centering": F_centering,
+		"sites": {'a4': "0,0,0", 'b4': "1/2,1/2,1/2", 'c4': "1/4,1/4,1/4", 'd4': "3/4,3/4,3/4"},
+		"swaps": [{'a4':'b4','b4':'a4','c4':'d4','d4':'c4'}, {'a4':'c4','c4':'b4','b4':'d4','d4':'a4'}, {'c4':'d4','d4':'c4'}]},
+	"SG224": {"lattice": "cubic", "laue": "m-3m", "acentric": False, "heusler": True,	#origin choice 1, Cu2O
+		"symops": ["-x,-y,z", "-x,y,-z", "z,x,y", "y+1/2,x+1/2,-z+1/2", "-x+1/2,-y+1/2,-z+1/2"], "centering": [],
+		"sites": {'a2': "0,0,0", 'b4': "1/4,1/4,1/4", 'c4': "3/4,3/4,3/4", 'd6': "0,1/2,1/2"},
+		"swaps": [{'b4':'c4','c4':'b4'}]},
+	"SG221": {"lattice": "cubic", "laue": "m-3m", "acentric": False,	#B2 CsCl
+		"symops": m3m, "centering": [],
+		"sites": {'a1': "0,0,0", 'b1': "1/2,1/2,1/2", 'c3': "0,1/2,1/2", 'd3': "1/2,0,0"},
+		"swaps": [{'a1':'b1','b1':'a1','c3':'d3','d3':'c3'}]},
+	"SG229": {"lattice": "cubic", "laue": "m-3m", "acentric": False,	#A2 bcc
+		"symops": m3m, "centering": I_centering,
+		"sites": {'a2': "0,0,0", 'b6': "0,1/2,1/2", 'c8': "1/4,1/4,1/4"},
+		"swaps": []},
+	"SG194": {"lattice": "hexagonal", "laue": "6/mmm", "acentric": False,
+		"symops": ["-y,x-y,z", "-x,-y,z+1/2", "y,x,-z", "-x,-y,-z"], "centering": [],
+		"sites": {'a2': "0,0,0", 'b2': "0,0,1/4", 'c2': "1/3,2/3,1/4", 'd2': "1/3,2/3,3/4",
+			'e4': "0,0,z", 'f4': "1/3,2/3,z", 'g6': "1/2,0,0", 'h6': "x,2x,1/4"},
+		"swaps": [{'c2':'d2','d2':'c2'}]},
+	"SG139": {"lattice": "tetragonal", "laue": "4/mmm", "acentric": False,
+		"symops": i4mmm, "centering": I_centering,
+		"sites": {'a2': "0,0,0", 'b2': "0,0,1/2", 'c4': "0,1/2,0", 'd4': "0,1/2,1/4", 'e4': "0,0,z"},
+		"swaps": [{'a2':'b2','b2':'a2'}]},
+	"SG123": {"lattice": "tetragonal", "laue": "4/mmm", "acentric": False,	#L1_0 CuAu
+		"symops": i4mmm, "centering": [],
+		"sites": {'a1': "0,0,0", 'b1': "0,0,1/2", 'c1': "1/2,1/2,0", 'd1': "1/2,1/2,1/2", 'e2': "0,1/2,1/2", 'f2': "0,1/2,0"},
+		"swaps": [{'a1':'c1','c1':'a1','b1':'d1','d1':'b1'}, {'a1':'b1','b1':'a1','c1':'d1','d1':'c1','e2':'f2','f2':'e2'}]},
+	"SG46": {"lattice": "orthorhombic", "laue": "mmm", "acentric": True,
+		"symops": ["-x,-y,z", "x+1/2,-y,z"], "centering": I_centering,
+		"sites": {'c8': "x,y,z", 'b4': "1/4,y,z", 'a4': "0,0,z"},
+		"swaps": []},
+	}
+
+#the old names, kept for the searches
+laue_class = dict([(n,g["laue"]) for n,g in space_groups.items()])
+acentric = [n for n,g in space_groups.items() if g["acentric"]]
+site_swaps = dict([(n,g["swaps"]) for n,g in space_groups.items()])
+heusler_groups = [n for n,g in space_groups.items() if g.get("heusler")]	#fcc-derived, peaks get F1-F4 classes
+
+# Wyckoff orbits from the symmetry operators. an operator or position "x+1/2,-y,z" is read as
+# (W, w): an integer matrix on (x,y,z) and an exact Fraction translation. the operators are
+# multiplied out into the whole group (modulo lattice translations and the centering, which
+# rules() takes care of), then applied to the representative of a site. images with the same
+# W and the same w (mod 1, mod centering) are the same atom, written as the representative
+# itself (first) or the smallest of the copies. each orbit is done once per
+# space group and site, as W [atom][3][3] and w [atom][3]; the positions for given x, y, z are
+# cached too, so the searches can regenerate them on every step
+
+orbit_cache = {}
+orbit_lock = threading.Lock()
+site_cache = OrderedDict()		#(space group, site, x, y, z) -> site tuple, least recently used goes first
+site_cache_size = 1024
+
+def symop(text):	#"-y,x-y,z+1/2" -> (W, w), W a tuple of rows, w Fractions
+	W,w = [],[]
+	for part in text.replace(" ","").split(","):
+		row,shift = [0,0,0],Fraction(0)
+		for term in re.findall(r'[+-]?[^+-]+',part):
+			if (term[-1] in "xyz"):
+				n = term[:-1].lstrip("+")
+				row["xyz".index(term[-1])] += int(n+"1" if n in ("","-") else n)
+			else:
+				shift += Fraction(term)
+		W.append(tuple(row))
+		w.append(shift)
+	return((tuple(W),tuple(w)))
+
+def reduce_shift(w,centering):	#w mod 1, the smallest of its copies under the centering
+	return(sorted([tuple([(a+b)%1 for a,b in zip(w,c)]) for c in [(0,0,0)]+centering])[0])
+
+def apply_op(op,pos,centering):	#op acting on pos, both (W, w)
+	(R,t),(W,w) = op,pos
+	RW = tuple([tuple([R[i][0]*W[0][n]+R[i][1]*W[1][n]+R[i][2]*W[2][n] for n in range(3)]) for i in range(3)])
+	Rw = [R[i][0]*w[0]+R[i][1]*w[1]+R[i][2]*w[2]+t[i] for i in range(3)]
+	return((RW,reduce_shift(Rw,centering)))
+
+def group_operators(space_group):	#every (W, w) of the group, modulo centering, and the centering
+	with orbit_lock:
+		ops = orbit_cache.get(space_group)
+	if ops is None:
+		g = space_groups[space_group]
+		centering = [symop(c)[1] for c in g["centering"]]
+		gens = [symop(s) for s in g["symops"]]
+		identity = (((1,0,0),(0,1,0),(0,0,1)),(0,0,0))
+		group = [identity]
+		for op in group:		#multiply generators until nothing new
+			for gen in gens:
+				new = apply_op(gen,op,centering)
+				if new not in group:
+					group.append(new)
+		ops = (group,centering)
+		with orbit_lock:
+			orbit_cache[space_group] = ops
+	return(ops)
+
+def orbit_table(space_group,name):	#(W, w) of every atom of a site, and as arrays
+	key = (space_group,name)
+	with orbit_lock:
+		table = orbit_cache.get(key)
+	if table is None:
+		group,centering = group_operators(space_group)
+		start = symop(space_groups[space_group]["sites"][name])
+		start = (start[0],tuple([v%1 for v in start[1]]))
+		atoms = set([apply_op(op,start,centering) for op in group])
+		atoms = sorted([a if a!=apply_op(group[0],start,centering) else start for a in atoms],key=lambda a: (a!=start,a[1],a[0]))
+		table = (atoms,array([a[0] for a in atoms],dtype=int),array([[float(v) for v in a[1]] for a in atoms]))
+		with orbit_lock:
+			orbit_cache[key] = table
+	return(table)
+
+def wyckoff_orbit(space_group,name,x,y,z):	#the site tuple (name, (x,y,z), ...), x, y, z numbers or arrays
+	key = (space_group,name,x,y,z) if all([isscalar(v) for v in (x,y,z)]) else None
+	if key is not None:
+		with orbit_lock:
+			site = site_cache.get(key)
+			if site is not None:
+				site_cache.move_to_end(key)
+				return(site)
+	atoms,W,w = orbit_table(space_group,name)
+	p = (x,y,z)
+	site = [name]
+	for M,t in zip(W.tolist(),w.tolist()):
+		position = []
+		for i in range(3):
+			c = t[i]
+			for j in range(3):
+				if (M[i][j]!=0):
+					c = c+M[i][j]*p[j]
+			position.append(c)
+		site.append(tuple(position))
+	site = tuple(site)
+	if key is not None:
+		with orbit_lock:
+			site_cache[key] = site
+			if (len(site_cache)>site_cache_size):
+				site_cache.popitem(last=False)
+	return(site)
+
+def free_parameters(space_group,name):	#does the site move with x, y, z?
+	return(bool(orbit_table(space_group,name)[1].any()))
+
+def named_site(space_group,name):	#(x,y,z) -> site, for SearchXYZ
+	return(lambda x,y,z: wyckoff_orbit(space_group,name,x,y,z))
+
+def free_sites(space_group):	#{site name: named_site()} for the sites of a space group with free x, y, z
+	return(dict([(s,named_site(space_group,s)) for s in space_groups[space_group]["sites"] if free_parameters(space_group,s)]))
+
+def wyckoff_sites(cfg):		#Wyckoff positions of cfg.space_group, with cfg.x, y, z where needed
+	Sites = positions()
+	for name in space_groups[cfg.space_group]["sites"]:
+		setattr(Sites,name,wyckoff_orbit(cfg.space_group,name,cfg.x,cfg.y,cfg.z))
+	return(Sites)
+
+def lattice(cfg):	#"cubic", "tetragonal", "hexagonal" or "orthorhombic"
+	return(space_groups[cfg.space_group]["lattice"])
+
+#element data: atomic scattering factors, atomic numbers
+Al = 13  #these assignments are to make the scattering factor matrices readable
+Si = 14
+Ti = 22
+V  = 23
+Cr = 24
+Mn = 25
+Fe = 26
+Co = 27
+Ni = 28
+Cu = 29
+Zn = 30
+Ga = 31
+Ge = 32
+Sn = 50
+Sb = 51
+Gd = 64
+FeCo = 100
+Va = 0		#vacancy, all its scattering factor entries are zero
+
+elements = {      		#this structure is to make output readable mostly
+	'0':'Va',
+	'13':'Al',
+	'14':'Si',
+	'22':'Ti',
+	'23':'V',
+	'24':'Cr',
+	'25':'Mn',
+	'26':'Fe',
+	'27':'Co',
+	'28':'Ni',
+	'29':'Cu',
+	'30':'Zn',
+	'31':'Ga',
+	'32':'Ge',
+	'50':'Sn',
+	'51':'Sb',
+	'64':'Gd',
+	'100':'FeCo',
+	}
+
+# element database. one row per atomic number Z (0-110) in a numpy structured array, so
+# element_data()[Z] works for one Z or a whole array of them:
+#	a, b, c		5 gaussian fo = sum a[i] * exp[-b[i]*s^2] + c, s=sin(theta)/lambda
+#	poly		or fo as a 5th order polynomial in s, for elements with no gaussian fit here
+#	fp, fpp		f' and f" (dispersion corrections), one column per tube in wavelengths
+#	B			Debye-Waller factor in (angstrom)^2, 0 = none known, no correction
+# elements with neither fit (and Va) have fo = 0. the table is built from the lists below
+# the first time it is needed. with cfg.element_cache_dir set it is also saved there as a
+# .npy, which later runs memory-map instead of building it again; the file name has a hash
+# of the lists in it, so editing them makes a new one. by default nothing is written
+
+# 5 gaussian approximation to f(s) from ref below. this is what VESTA does fyi.
+# Acta Cryst. (1995). A51,416-431
+# New Analytical Scattering-Factor Functions for Free Atoms and Ions
+# BY D. WAASMAIER AND A. KIRFEL
+# alternatively see data at 
+# http://it.iucr.org/Cb/ch6o1v0001/sec6o1o1/ table 6.1.1.1 for fo 
+# and approximate as you will
+# Note Fe and Co are tough b/c near absorption for Co, Cu Ka radiation. Careful!
+
+#Z: (a1..a5), (b1..b5), c
+fo_gaussian = {
+	22: ((9.818524,1.522646,1.703101,1.768774,7.082555), (8.001879,0.029763,39.885423,120.1580,0.532405), 0.102473),		#Ti
+	26: ((12.311098,1.876623,3.066177,2.070451,6.975185), (5.009415,0.014461,18.743041,82.767874,0.346506), -0.304931),	#Fe
+	27: ((12.914510,2.481908,3.466894,2.106351,6.960892), (4.507138,0.009126,16.438130,76.987317,0.314418), -0.936572),	#Co
+	32: ((16.540614,1.567900,3.727829,3.345098,6.785079), (2.866618,0.012198,13.432163,58.866046,0.210974), 0.018726),	#Ge
+	}
+
+# 5th order polynomial fits to fo vs s from the 3_8 version of this program, made to
+# http://it.iucr.org/Cb/ch6o1v0001/sec6o1o1/ table 6.1.1.1. they are good to ~0.3% up to
+# s = poly_smax and run away past it, so from there on fo carries on as a gaussian in s
+# with the same value and slope (within ~10% of the gaussian fits above out to s = 0.6)
+poly_smax = 0.40
+
+#Z: (p0..p5), fo = sum p[i]*s^i
+fo_polynomial = {
+	13: (13.000,1.5744,-347.93,1974.7,-4533.9,3760.6),		#Al
+	14: (13.986,3.2804,-375.64,1954.7,-4126.7,3179.2),		#Si
+	23: (23.018,-0.3458,-422.51,2194.2,-4992.1,4262.4),		#V
+	24: (24.012,-0.2731,-340.71,1512.3,-3120,2533.2),		#Cr
+	25: (25.005,1.0076,-405.86,1968.7,-4290.2,3555.6),		#Mn
+	28: (27.996,1.8709,-370.04,1638.4,-3371.7,2865.9),		#Ni
+	29: (29.000,0.8695,-290.18,1092.2,-2046.2,1570.7),		#Cu
+	30: (29.993,2.0638,-345.01,1442.4,-2860.7,2220),		#Zn
+	31: (30.997,1.6692,-391.71,1769.8,-3634.4,2838.8),		#Ga
+	50: (49.989,3.5716,-619.41,2713.6,-5432.4,4210.2),		#Sn
+	51: (50.975,5.443,-664.91,2895.8,-5644.3,4213.4),		#Sb
+	64: (64.058,-5.0071,-653.45,3073.1,-6751.1,5752.2),		#Gd
+	100: (26.5,1.55225,-388.725,1800.75,-3813.7,3099.75),	#FeCo, average of the Fe and Co fits
+	}
+
+# dispersion corrections, f' and f" at Co Ka, Cu Ka (the order of wavelengths)
+# for Ti, Fe, Co, Ge:
+# linear interpolation of https://physics.nist.gov/PhysRefData/FFast/html/form.html
+# INCLUDES nuclear thompson and relativistic corrections to f1
+# so (my f') = f' + f_NT = f1 + f_rel + f_NT - Z as they put it
+# the rest are from http://it.iucr.org/Cb/ch4o2v0001/sec4o2o6/ table 4.2.6.8 
+# (as in the 3_8 version), which ends up being very close
+
+#Z: ((f' Co, f" Co), (f' Cu, f" Cu))
+dispersion_data = {
+	13: ((0.2551,0.3276), (0.2130,0.2455)),		#Al
+	14: ((0.2979,0.4384), (0.2541,0.3302)),		#Si
+	22: ((-0.15370,2.3142), (-0.13049,1.8070)),	#Ti
+	23: ((-0.3871,2.6994), (0.0687,2.1097)),		#V
+	24: ((-0.9524,3.1130), (-0.1635,2.4439)),	#Cr
+	25: ((-2.0793,3.5546), (-0.5299,2.8052)),	#Mn
+	26: ((-3.3891,0.47507), (-1.285,3.185)),		#Fe
+	27: ((-2.0998,0.55705), (-2.7647,3.6398)),	#Co
+	28: ((-1.5664,0.6662), (-3.0029,0.5091)),	#Ni
+	29: ((-1.2789,0.7700), (-1.9646,0.5888)),	#Cu
+	30: ((-1.0843,0.8857), (-1.5491,0.6778)),	#Zn
+	31: ((-0.9200,1.0138), (-1.2846,0.7736)),	#Ga
+	32: ((-0.72563,1.1446), (-1.1475,0.88279)),	#Ge
+	50: ((-0.3097,6.9896), (0.0259,5.4591)),		#Sn
+	51: ((-0.5189,7.5367), (-0.0562,5.8946)),	#Sb
+	64: ((-9.3863,3.9016), (-8.8380,11.9157)),	#Gd
+	100: ((-2.67685,0.5316), (-1.74945,3.40585)),	#FeCo, average of the Fe and Co values above (3_8)
+	}
+
+# do NOT average structure factors to mix elements. 
+# since intensity depends on f^2, this will not work right. instead, adjust occupancy.
+# can have e.g. X = [Fe,Sites.h6,2.0/3] and Y = [Mn,Sites.h6,1.0/3] to randomize sites
+
+# Debye-Waller factor B in (angstrom)^2 from 
+# DebyeWaller Factors and Absorptive Scattering Factors of Elemental Crystals
+# L.-M. Peng, G. Ren, S. L. Dudarev and M. J. Whelan
+# Acta Crystallographica Section A Foundations of Crystallography
+# or otherwise where noted
+# we use data from elemental crystals (not ions) for lack of anything better.
+
+#NEW 1/2022 - found a polynomial parameterization of debye-waller factors.
+#https://journals.iucr.org/a/issues/1999/05/00/sp0169/sp0169.pdf
+
+#quoth KC Shambhu, I tried for Co, Fe, and Ge with reference to the values that we used for the high moment paper. Those values were taken at 295K. Using the parametrization, I get a 5% difference for Fe, 2 % for Ge, and 0.5% for Co. So, we can use this method to get B for Mn, which I get as 0.385 at 295K. [values he's citing are those noted below for those elements]
+
+debye_waller_B = {
+	22: 0.5173,		#Ti, Peng et al. @ 295K. also B=0.55 https://www.publish.csiro.au/ph/pdf/ph880461
+	25: 0.385,		#Mn, from the 1999 parameterization above @ 295K
+	26: 0.3272,		#Fe, Peng et al. @ 295K bcc
+	27: 0.307,		#Co, https://onlinelibrary.wiley.com/iucr/doi/10.1107/S0108767399005176
+					#also a value of 0.39 at https://www.publish.csiro.au/ph/pdf/ph880461
+	32: 0.6041,		#Ge, Peng et al. @ 295K
+	}
+
+element_dtype = np.dtype([("Z",int16), ("symbol","U4"), ("a",float64,5), ("b",float64,5), ("c",float64),
+	("poly",float64,6), ("fp",float64,len(wavelengths)), ("fpp",float64,len(wavelengths)), ("B",float64)])
+
+element_store = {}
+element_lock = threading.Lock()
+
+def build_element_table():	#the lists above as one structured array, [Z]
+	table = zeros(111,dtype=element_dtype)  #roentgenium
+	table["Z"] = arange(111)
+	for Z in range(111):
+		table["symbol"][Z] = elements.get(str(Z),"")
+	for Z,(a,b,c) in fo_gaussian.items():
+		table["a"][Z],table["b"][Z],table["c"][Z] = a,b,c
+	for Z,p in fo_polynomial.items():
+		table["poly"][Z] = p
+	for Z,values in dispersion_data.items():
+		table["fp"][Z] = [fp for fp,fpp in values]
+		table["fpp"][Z] = [fpp for fp,fpp in values]
+	for Z,B in debye_waller_B.items():
+		table["B"][Z] = B
+	return(table)
+
+def element_data(cache_dir=""):		#the element table, memory-mapped from cache_dir if it is there
+	with element_lock:
+		if "table" in element_store:
+			return(element_store["table"])
+		if (not cache_dir):
+			element_store["table"] = build_element_table()
+			return(element_store["table"])
+		source = repr([fo_gaussian,poly_smax,fo_polynomial,dispersion_data,debye_waller_B,elements,element_dtype.descr])
+		name = os.path.join(cache_dir,"elements-%s.npy"%(hashlib.sha256(source.encode()).hexdigest()[:16]))
+		try:
+			table = np.load(name,mmap_mode='r')
+		except (OSError,ValueError):
+			table = build_element_table()
+			try:
+				os.makedirs(cache_dir,exist_ok=True)
+				tmp = "%s.%d.tmp.npy"%(name,os.getpid())
+				np.save(tmp,table)
+				os.replace(tmp,name)
+			except OSError:
+				pass		#read-only install, just keep it in memory
+		element_store["table"] = table
+		return(table)
+
+def xray_column(XRAY):		#which fp, fpp column goes with this tube. anything else gets Cu
+	if XRAY in wavelengths:
+		return(list(wavelengths).index(XRAY))
+	return(list(wavelengths).index("Cu"))
+
+def fo_poly(p,s):	#polynomial fo, p[...,0:6], with the gaussian tail past poly_smax. 0 where p is 0
+	s = asarray(s)
+	s0 = minimum(s,poly_smax)
+	fo = 0
+	slope = 0
+	for i in range(6):
+		fo = fo + p[...,i]*s0**i
+		if (i>0):
+			slope = slope + i*p[...,i]*s0**(i-1)
+	with errstate(invalid='ignore',divide='ignore'):
+		k = where(fo!=0, -slope/(2.0*s0*fo), 0)		#fo(s) = fo(s0)*exp(-k*(s^2-s0^2))
+	return(fo*exp(-k*(s*s-s0*s0)))
+
+# generate atomic scattering factor with the data in the table above
+# we are not doing the thickness/absorption correction yet
+# for films, you need to add the absorption/thickness correction later to each peak
+# can turn off dispersion (f', f) and Debye-Waller corrections to compare with other
+# software or just see how much they matter. turning off dispersion also turns off
+# the nuclear-Thompson and relativistic corrections to f' of course
+
+def f(cfg,element,d):  			#d can be a single value or an array, element one Z or an array of them
+	e = element_data(cfg.element_cache_dir)[element]
+	s = 1.0/(2.0*asarray(d))    #sin(theta)/lambda
+	f=0
+	for i in range(5):
+		f = f + e["a"][...,i]*exp(-e["b"][...,i]*s*s)
+		#sum a_i * exp(-b_i s^2)  gaussian approx to fo
+	f = f + e["c"]  # + c
+	f = f + fo_poly(e["poly"],s)		#elements with the polynomial fit instead (0 for the rest)
+	if (cfg.DISPERSION): #add dispersion f' and f''. note f'' is imaginary
+		col = xray_column(cfg.XRAY)
+		f = f + (e["fp"][...,col] + 1j*e["fpp"][...,col])
+	if (cfg.DEBYE_WALLER):
+		f = f*exp(-e["B"]*s*s)
+		#f_tot = (fo + f' + f'')*DW
+	return (f[()])		#complex, because of f''
+
+# f' and f" vs x-ray energy, for scans across absorption edges (EnergyScan). dispersion_data
+# only has the two tube energies, which for Fe and Co sit on either side of the K edge, so
+# anything in between needs a real table: load_dispersion() reads one per element, e.g. saved
+# from the FFAST page above, as energy (keV), f', f" columns (comma or space separated, f'
+# including f_rel and f_NT as above, anything that isn't three numbers is skipped). like FFAST
+# suggests, f" is interpolated log-log and f' linear in log(E). past the ends of a table the
+# end values are used. elements with no table fall back to the two tube values, and
+# EnergyScan() warns about either
+
+hc = 12.398419843320026		#keV*angstrom, E = hc/lambda
+dispersion_tables = {}
+dispersion_lock = threading.Lock()
+
+def load_dispersion(element,filename):	#energy (keV), f', f" table for one element (Z)
+	rows = []
+	for line in open(filename):
+		try:
+			E,fp,fpp = [float(x) for x in line.replace(","," ").split()]
+		except ValueError:
+			continue		#header lines, or more/fewer columns
+		rows.append((E,fp,fpp))
+	table = array(rows).reshape(-1,3)
+	table = table[argsort(table[:,0],kind='stable')]	#keep the order of repeated energies at an edge
+	with dispersion_lock:
+		dispersion_tables[element] = (table[:,0],table[:,1],table[:,2])
+
+def dispersion_table(element):	#(energies, f', f") for this element, the tube values if nothing was loaded
+	with dispersion_lock:
+		table = dispersion_tables.get(element)
+	if table is None:
+		e = element_data()[element]
+		E = array([hc/wavelengths[tube][0] for tube in wavelengths])	#same order as the fp, fpp columns
+		order = argsort(E)
+		table = (E[order],array(e["fp"])[order],array(e["fpp"])[order])
+	return(table)
+
+def dispersion_coverage(element,energies):	#why f', f" of this element can't be trusted at these energies, or None
+	with dispersion_lock:
+		table = dispersion_tables.get(element)
+	if (table is None):
+		return("no f', f\" table for %s, only the Co and Cu Ka values (interpolating across an edge between them is meaningless)"%(elements.get(str(element),element)))
+	E = asarray(energies,dtype=float)
+	if (E.min()<table[0][0] or E.max()>table[0][-1]):
+		return("energies %.3f-%.3f keV go past the f', f\" table for %s (%.3f-%.3f keV), its end values are used there"%(E.min(),E.max(),elements.get(str(element),element),table[0][0],table[0][-1]))
+	return(None)
+
+def dispersion_at(element,energies):	#f', f" at each energy (keV)
+	E,fp,fpp = dispersion_table(element)
+	x = log(asarray(energies,dtype=float))
+	fp_E = interp(x,log(E),fp)
+	if (fpp>0).all():
+		fpp_E = exp(interp(x,log(E),log(fpp)))
+	else:
+		fpp_E = interp(x,log(E),fpp)		#zeros (Va etc) don't go on a log scale
+	return(fp_E,fpp_E)
+
+# f over a whole list of reflections, worked out once per distinct d (shell) and cached.
+# sweeps over composition/occupancy ask for the same elements at the same d over and
+# over, so those become lookups. oldest entries get dropped past f_cache_size. threads
+# share the cache; f itself is worked out outside the lock, so they only wait on the lookup
+
+f_cache = OrderedDict()
+f_cache_size = 256
+f_cache_lock = threading.Lock()
+
+def f_shells(cfg,element,d):
+	d = asarray(d)
+	key = (element,cfg.XRAY,cfg.DISPERSION,cfg.DEBYE_WALLER,d.tobytes())
+	with f_cache_lock:
+		fd = f_cache.get(key)
+		if fd is not None:
+			f_cache.move_to_end(key)
+	if fd is not None:
+		count(cfg,"f_cache_hits")
+		return(fd)
+	shells,index = unique(d,return_inverse=True)
+	fd = f(cfg,element,shells)[index].reshape(shape(d))
+	count(cfg,"f_evaluations",len(shells))
+	with f_cache_lock:
+		f_cache[key] = fd
+		if (len(f_cache)>f_cache_size):
+			f_cache.popitem(last=False)
+	return(fd)
+
+# reflection conditions, worked out from the symmetry operators. a rule is a list of tests
+# that all have to hold. a test (c,n,r) is (c[0]*h+c[1]*k+c[2]*l) % n == r, or == r exactly
+# with n = 0, e.g. [((1,0,0),0,0),((0,1,1),2,1)] is h=0 with k+l odd. hkl is extinct for every
+# structure in the group if an operator (W, w) has hkl.W = hkl but hkl.w is not an integer,
+# since the atoms it relates then scatter exactly out of phase. the centering translations
+# count as operators with W = 1. each group's rules are compiled once into integer arrays:
+# the coefficients c [test][3], modulus n and residue r of every test, and which tests make
+# up each rule [rule][test]. a rule holds where all of its tests pass. 000 is forbidden too
+
+group_cache = {}
+group_lock = threading.Lock()
+
+def exact_test(c):	#c.hkl = 0 as a test, with the smallest coefficients and the first one positive
+	g = int(gcd.reduce(c))
+	c = [v//g for v in c]
+	sign = -1 if [v for v in c if v!=0][0]<0 else 1
+	return((tuple([sign*v for v in c]),0,0))
+
+def derived_rules(space_group):	#the reflection conditions of a space group, as rules
+	group,centering = group_operators(space_group)
+	identity = ((1,0,0),(0,1,0),(0,0,1))
+	found = []
+	for W,w in group+[(identity,c) for c in centering]:
+		n = int(lcm.reduce([Fraction(v).denominator for v in w]))
+		if (n==1):
+			continue
+		fixed = []
+		for j in range(3):		#hkl.W = hkl
+			c = (W[0][j]-identity[0][j],W[1][j]-identity[1][j],W[2][j]-identity[2][j])
+			if (c!=(0,0,0) and exact_test(c) not in fixed):
+				fixed.append(exact_test(c))
+		shift = tuple([int(v*n) for v in w])
+		for r in range(1,n):		#hkl.w not an integer
+			rule = fixed+[(shift,n,r)]
+			if rule not in found:
+				found.append(rule)
+	m = 2*int(lcm.reduce([1]+[rule[-1][1] for rule in found]))+2		#a few periods of every rule
+	h = arange(-m,m+1)		#drop the ones the others already cover
+	H,K,L = [a.ravel() for a in meshgrid(h,h,h,indexing='ij')]
+	H,K,L = [a[(H!=0) | (K!=0) | (L!=0)] for a in (H,K,L)]
+	kept = []
+	for rule in sorted(found,key=len):		#fewest tests, so the most general, first
+		holds = matches(compile_rules([rule]),H,K,L)
+		if (holds.any() and not (matches(compile_rules(kept),H,K,L)>=holds).all()):
+			kept.append(rule)
+	return(kept)
+
+def compile_rules(rules):	#(c, n, r, member) arrays for a list of rules
+	tests = [t for rule in rules for t in rule]
+	c = array([t[0] for t in tests],dtype=int).reshape(-1,3)
+	n = array([t[1] for t in tests],dtype=int)
+	r = array([t[2] for t in tests],dtype=int)
+	member = zeros((len(rules),len(tests)),dtype=bool)
+	start = 0
+	for j,rule in enumerate(rules):
+		member[j,start:start+len(rule)] = True
+		start += len(rule)
+	return((c,n,r,member))
+
+def group_rules(space_group):	#compiled reflection conditions of a space group
+	with group_lock:
+		table = group_cache.get(space_group)
+	if table is None:
+		table = compile_rules(derived_rules(space_group)+[[((1,0,0),0,0),((0,1,0),0,0),((0,0,1),0,0)]])
+		with group_lock:
+			group_cache[space_group] = table
+	return(table)
+
+def matches(table,h,k,l):	#True where any of the compiled rules holds
+	c,n,r,member = table
+	passed = []
+	for i in range(len(n)):		#a handful of tests, each one over all hkl at once
+		v = c[i,0]*h+c[i,1]*k+c[i,2]*l
+		passed.append(v%n[i]==r[i] if n[i]>0 else v==r[i])
+	found = zeros(shape(h+k+l),dtype=bool)
+	for rule in member:
+		holds = ones(shape(found),dtype=bool)
+		for i in flatnonzero(rule):
+			holds &= passed[i]
+		found |= holds
+	return(found)
+
+def rules(cfg,h,k,l):	#general rules for allowed hkl
+	h,k,l = asarray(h),asarray(k),asarray(l)	#works on single hkl or whole arrays of them
+	allowed = ~matches(group_rules(cfg.space_group),h,k,l)
+	return(allowed[()])
+
+# exact phases. atoms on rational positions (0, 1/4, 1/3, ...) with common denominator D have
+# phases 2 pi r/D, r = (D*x*h+D*y*k+D*z*l) mod D, so S is a sum of D-th roots of unity, looked
+# up from a table instead of worked out with exp. whether S is exactly 0 is decided in
+# integers: sum_r X^r over the atoms has to be divisible by the cyclotomic polynomial Phi_D,
+# so the remainders of X^r mod Phi_D ([r][degree of Phi_D]) are added up next to the roots,
+# and S is set to 0 where they all cancel. with small D each remainder is packed into one
+# integer, 15 bits per coefficient, so that is one lookup per atom too. round-off can't
+# leave a 1e-30 "peak" behind.
+# for a site with free x, y, z the phase of each atom is (hkl.W).(x,y,z) + hkl.w, so atoms with
+# the same hkl.W have to cancel among themselves for every x, y, z. the same test on each of
+# those groups gives the hkl the site can't contribute to at any x, y, z
+
+phase_cache = {}
+phase_lock = threading.Lock()
+rational_cache = OrderedDict()		#site tuple -> rational_site(), least recently used goes first
+rational_cache_size = 1024
+
+def poly_divide(p,q):	#quotient and remainder of p/q, integer coefficients lowest power first, q monic
+	p = list(p)+[0]*(len(q)-1-len(p))		#at least as long as the remainder
+	quotient = [0]*(len(p)-len(q)+1)
+	for i in range(len(p)-len(q),-1,-1):
+		c = p[i+len(q)-1]
+		quotient[i] = c
+		for j in range(len(q)):
+			p[i+j] -= c*q[j]
+	return(quotient,p[:len(q)-1])
+
+def cyclotomic(n):	#coefficients of Phi_n, lowest power first
+	p = [-1]+[0]*(n-1)+[1]		#X^n - 1 is the product of Phi_d over the d dividing n
+	for d in range(1,n):
+		if (n%d==0):
+			p = poly_divide(p,cyclotomic(d))[0]
+	return(p)
+
+def phase_tables(D):	#D-th roots of unity, and X^r mod Phi_D as [r][degree]
+	with phase_lock:
+		tables = phase_cache.get(D)
+	if tables is None:
+		angle = 2*pi*arange(D)/D
+		snap = lambda v: where(abs(2*v-rint(2*v))<1e-12, rint(2*v)/2, v)	#0, 1/2, 1 exactly
+		roots = snap(cos(angle))+1j*snap(sin(angle))
+		phi = cyclotomic(D)
+		remainders = array([poly_divide([0]*r+[1],phi)[1] for r in range(D)],dtype=int)
+		packed = None
+		if (15*remainders.shape[1]<=60):
+			packed = dot(remainders,2**(15*arange(remainders.shape[1]))).astype(int64)
+		tables = (roots,remainders,packed)
+		with phase_lock:
+			phase_cache[D] = tables
+	return(tables)
+
+def site_key(site):	#hashable copy of a site, hand-typed ones are lists: ['b4', (x,y,z), ...]
+	return((site[0],)+tuple([tuple(p) for p in site[1:]]))
+
+def rational_site(site,largest=48):	#(D, D*positions as integers [atom][3]), or (0, None) if not all rational
+	if not all([isscalar(v) for p in site[1:] for v in p]):
+		return((0,None))
+	site = site_key(site)
+	with phase_lock:
+		found = rational_cache.get(site)
+		if found is not None:
+			rational_cache.move_to_end(site)
+			return(found)
+	pos = array(site[1:],dtype=float).reshape(-1,3)
+	scaled = arange(1,largest+1)[:,None,None]*pos
+	good = flatnonzero(abs(scaled-rint(scaled)).reshape(largest,-1).max(axis=1)<1e-9)
+	found = (0,None)
+	if (len(good)>0):
+		D = int(good[0])+1
+		found = (D,rint(D*pos).astype(int))
+	with phase_lock:
+		rational_cache[site] = found
+		if (len(rational_cache)>rational_cache_size):
+			rational_cache.popitem(last=False)
+	return(found)
+
+def exact_sum(n,D,h,k,l):	#S from the roots table, and where it is exactly 0
+	roots,remainders,packed = phase_tables(D)
+	if (len(n)>=2**14):		#too many atoms for the packed remainders
+		packed = None
+	S = 0
+	rem = 0
+	for x,y,z in n.tolist():
+		r = (x*h+y*k+z*l)%D
+		S = S+roots[r]
+		rem = rem+(remainders[r] if packed is None else packed[r])
+	return(S,(rem==0) if packed is not None else (rem==0).all(axis=-1))
+
+def free_extinct(space_group,site,h,k,l):	#where a site with free x, y, z is 0 at any x, y, z, or None
+	if (site[0] not in space_groups[space_group]["sites"]):
+		return(None)
+	atoms,W,w = orbit_table(space_group,site[0])
+	if (len(atoms)!=len(site)-1):		#not the orbit from the table
+		return(None)
+	D = int(lcm.reduce([Fraction(v).denominator for a in atoms for v in a[1]]))
+	roots,remainders,packed = phase_tables(D)
+	q = [[M[0][j]*h+M[1][j]*k+M[2][j]*l for j in range(3)] for M in W.tolist()]	#hkl.W of each atom
+	r = [remainders[(int(a[1][0]*D)*h+int(a[1][1]*D)*k+int(a[1][2]*D)*l)%D] for a in atoms]
+	zero = ones(shape(h+k+l),dtype=bool)
+	for i in range(len(atoms)):
+		rem = 0
+		for j in range(len(atoms)):		#the atoms with the same hkl.W as atom i
+			same = (q[i][0]==q[j][0]) & (q[i][1]==q[j][1]) & (q[i][2]==q[j][2])
+			rem = rem+same[...,None]*r[j]
+		zero &= (rem==0).all(axis=-1)
+	return(zero)
+
+# the Heusler fast path (XRD-heusler-phases.tex). an atom on one of the four fcc sublattices
+# 000, 1/4 1/4 1/4, 1/2 1/2 1/2, 3/4 3/4 3/4, give or take 0 or 1/2 on each axis, has the phase
+# i^(q(h+k+l) + 2 t.hkl) with q the sublattice in quarters and t the 0/1 shifts, so it only
+# depends on (h+k+l) mod 4 and the parities of h, k, l. a site made of such atoms is then one
+# table of 32 exact values (1, i, -1, -i summed), one lookup per reflection whatever the number
+# of atoms. for hkl all even or all odd the four columns are the F1-F4 classes of the notes:
+# F1 h+k+l = 4n (fundamental), F2 4n+2, F3 4n+1, F4 4n+3 (superlattice)
+
+class_cache = OrderedDict()		#site tuple -> sublattice_table(), least recently used goes first
+class_cache_size = 1024
+class_names = [("", "mixed"), ("F1", "fundamental"), ("F2", "superlattice"), ("F3", "superlattice"), ("F4", "superlattice")]
+
+def class_index(h,k,l):	#4*(parities of h, k, l as bits) + (h+k+l) mod 4, into sublattice_table()
+	return((((h&1)<<4) | ((k&1)<<3) | ((l&1)<<2)) + ((h+k+l)&3))
+
+def reflection_class(h,k,l):	#1-4 for F1-F4, 0 for mixed parity hkl
+	h,k,l = asarray(h),asarray(k),asarray(l)
+	unmixed = ((h-k)&1==0) & ((k-l)&1==0)
+	return(where(unmixed,array([1,3,2,4])[(h+k+l)&3],0)[()])
+
+def sublattice_table(site):	#F at each class_index(), or None if an atom is off the fcc sublattices
+	site = site_key(site)
+	with phase_lock:
+		found = class_cache.get(site,False)
+		if found is not False:
+			class_cache.move_to_end(site)
+			return(found)
+	D,n = rational_site(site)
+	found = None
+	if (D>0 and 4%D==0):
+		n = n*(4//D)		#in quarters
+		if ((n-n[:,:1])%2==0).all():
+			index = arange(32)
+			parity = array([(index>>4)&1,(index>>3)&1,(index>>2)&1])
+			found = zeros(32,dtype=complex)
+			for a,b,c in n.tolist():
+				t = array([a-a%2,b-a%2,c-a%2])//2
+				found = found+array([1,1j,-1,-1j])[((a%2)*(index&3)+2*dot(t,parity))%4]
+	with phase_lock:
+		class_cache[site] = found
+		if (len(class_cache)>class_cache_size):
+			class_cache.popitem(last=False)
+	return(found)
+
+#calculate structure factor, exactly 0 for hkl the site can't contribute to
+
+def F_hkl(cfg,site,h,k,l):		#h,k,l can be single values or arrays
+	h,k,l = asarray(h),asarray(k),asarray(l)
+	D,n = rational_site(site)
+	table = sublattice_table(site) if (D>0 and issubdtype(result_type(h,k,l),integer)) else None
+	if table is not None:
+		S,zero = table[class_index(h,k,l)],None	#exact already
+	elif (D>0 and issubdtype(result_type(h,k,l),integer)):
+		S,zero = exact_sum(n,D,h,k,l)
+	else:
+		S=0		#sum over atoms in the site
+		for i in range (1,len(site)):
+			S = S + exp(2*pi*1j*(site[i][0]*h+site[i][1]*k+site[i][2]*l))
+		zero = free_extinct(cfg.space_group,site,h,k,l) if issubdtype(result_type(h,k,l),integer) else None
+	S = S*ones(shape(h+k+l))
+	F = S if zero is None else where(zero, 0, S)
+	count(cfg,"F_hkl_evaluations",size(F))
+	return (F[()])
+
+#find d spacing, bragg angle, and Lorentz-polarization factors. 1/d^2 = hkl.G*.hkl with
+#G* the reciprocal metric tensor, inv(cell_vectors.cell_vectors^T), done once per lattice
+
+metric_cache = {}
+metric_lock = threading.Lock()
+
+def reciprocal_metric(cfg):
+	key = (lattice(cfg),)+axes(cfg)
+	with metric_lock:
+		G = metric_cache.get(key)
+	if G is None:
+		V = cell_vectors(cfg)
+		G = np.linalg.inv(dot(V,V.T))
+		with metric_lock:
+			metric_cache[key] = G
+	return(G)
+
+def inv_d2(cfg,h,k,l):								#1/d^2 for hkl
+	G = reciprocal_metric(cfg)
+	tmp = G[0,0]*h*h + G[1,1]*k*k + G[2,2]*l*l
+	for (i,j),a,b in [((0,1),h,k),((0,2),h,l),((1,2),k,l)]:	#cross terms, only hexagonal so far
+		if (G[i,j]!=0):
+			tmp = tmp + 2*G[i,j]*a*b
+	return (tmp)
+
+def d_hkl(cfg,h,k,l):								#d spacing for hkl
+	return (1.0/sqrt(inv_d2(cfg,h,k,l)))
+
+def axes(cfg):		#lengths of the real space a,b,c axes
+	return(tuple([getattr(cfg,n) for n in lattices[lattice(cfg)][:3]]))
+
+def cell_vectors(cfg):		#real space a, b, c as the rows, cartesian, angstroms. a along x
+	a,b,c = axes(cfg)
+	cos_gamma = lattices[lattice(cfg)][3]
+	return(array([[a,0,0],[b*cos_gamma,b*sqrt(1.0-cos_gamma**2),0],[0,0,c]]))
+
+def bragg(d,Lambda):   #just spits back 2theta given d and lambda
+	tmp = Lambda/(2.0*asarray(d))
+	with errstate(invalid='ignore'):
+		angle = where(tmp<=1, 2.0*degrees(arcsin(tmp)), 0)	#0 for bad arcsin
+	return(angle[()])
+
+def Lorentz_Pol(cfg,d,Lambda):
+	tmp = Lambda/(2.0*asarray(d))
+	with errstate(invalid='ignore',divide='ignore'):
+		theta = arcsin(tmp) #radians!
+		if (cfg.SAMPLE_TYPE==POWDER):
+			LP = (1.0+(cos(2.0*theta))**2)/(sin(theta)*sin(2.0*theta))
+		elif (cfg.SAMPLE_TYPE==SINGLE_XTAL):
+			LP = (1.0+(cos(2.0*theta))**2)/(2.0*sin(2.0*theta))
+		else:
+			LP = zeros(shape(tmp))			#bad specimen type
+	LP = where(tmp<=1.0, LP, 0)	#0 for bad arcsin
+	return(LP[()])
+
+def thickness(cfg,d,Lambda,MU=None):	#thin film thickness correction factor, cfg.MU unless given
+	if (MU is None):
+		MU = cfg.MU
+	if (cfg.FILM):
+		G = 1.0-exp(-4.0*MU*cfg.THICKNESS*asarray(d)/Lambda)
+	else:
+		G = ones(shape(d))
+	return(G[()])
+
+# linear absorption coefficient from what is actually in the cell, for AUTO_MU=1. at these
+# energies absorption is nearly all photoabsorption, with a cross section per atom of
+# sigma = 2 r_e lambda f" (optical theorem), so mu = sum_j n_j sigma_j / V with n_j the
+# atoms of each element in the cell (Wyckoff multiplicity x occupancy). f" is already in the
+# element table for each tube, so no extra data is needed. Compton and Rayleigh scattering
+# are left out, a few % of mu for these elements at Co/Cu Ka. sigma for all Z is cached per
+# tube and wavelength. e.g. L21 Co2FeGe, a = 5.75: 2075 1/cm at Cu Ka
+
+r_e = 2.8179403262e-13		#classical electron radius, cm
+attenuation_cache = {}
+attenuation_lock = threading.Lock()
+
+def cross_sections(XRAY,Lambda,cache_dir=""):	#absorption cross section per atom in cm^2, [Z]
+	key = (XRAY,float(Lambda))
+	with attenuation_lock:
+		sigma = attenuation_cache.get(key)
+	if sigma is None:
+		sigma = 2.0*r_e*Lambda*1e-8*array(element_data(cache_dir)["fpp"][:,xray_column(XRAY)])
+		with attenuation_lock:
+			attenuation_cache[key] = sigma
+	return(sigma)
+
+def cell_volume(cfg):		#angstrom^3
+	a,b,c = axes(cfg)
+	return(a*b*c*sqrt(1.0-lattices[lattice(cfg)][3]**2))
+
+def site_count(cfg,site):	#atoms on a full site in the conventional cell: the positions listed, times the centering
+	return((len(site)-1)*(1+len(space_groups[cfg.space_group]["centering"])))	#hand-typed sites too, whatever their name
+
+def absorption_mu(cfg,atoms,Lambda=None,occupancies=None):	#mu in 1/cm, one per row of occupancies if given
+	if (Lambda is None):
+		Lambda = cfg.Lambda
+	per_atom = cross_sections(cfg.XRAY,Lambda,cfg.element_cache_dir)[[X[0] for X in atoms]]*array([site_count(cfg,X[1]) for X in atoms])
+	if (occupancies is None):
+		occupancies = [X[2] for X in atoms]
+	return(dot(asarray(occupancies,dtype=float),per_atom)/(cell_volume(cfg)*1e-24))
+
+def film_mu(cfg,atoms,Lambda=None):	#the MU for thickness(): cfg.MU, or from the atoms with AUTO_MU
+	if (cfg.AUTO_MU):
+		return(absorption_mu(cfg,atoms,Lambda))
+	return(cfg.MU)
+
+# Laue class of each space group. with SYMMETRY_REDUCE we only compute the hkl in the
+# asymmetric unit of reciprocal space and multiply by how many equivalent hkl there are.
+# the operators act on (h,k,l) as a column vector. for hexagonal, i=-(h+k) is implied
+# (laue_class and acentric come from space_groups. acentric: no inversion center, so
+# |F(hkl)| != |F(-h-k-l)| with dispersion)
+
+laue_generators = {
+	"m-3m":  [[[0,0,1],[1,0,0],[0,1,0]], [[0,-1,0],[1,0,0],[0,0,1]], [[-1,0,0],[0,-1,0],[0,0,-1]]],
+	"6/mmm": [[[0,1,0],[-1,-1,0],[0,0,1]], [[-1,0,0],[0,-1,0],[0,0,1]], [[0,1,0],[1,0,0],[0,0,1]], [[1,0,0],[0,1,0],[0,0,-1]]],
+	"4/mmm": [[[0,-1,0],[1,0,0],[0,0,1]], [[0,1,0],[1,0,0],[0,0,1]], [[-1,0,0],[0,-1,0],[0,0,-1]]],
+	"mmm":   [[[-1,0,0],[0,1,0],[0,0,1]], [[1,0,0],[0,-1,0],[0,0,1]], [[1,0,0],[0,1,0],[0,0,-1]]],
+	}
+
+laue_cache = {}
+laue_lock = threading.Lock()
+
+def laue_ops(laue):		#every operation in the Laue group, by multiplying generators until nothing new. once per class
+	with laue_lock:
+		ops = laue_cache.get(laue)
+	if ops is None:
+		gens = [array(g) for g in laue_generators[laue]]
+		found = [identity(3,dtype=int)]
+		seen = set([found[0].tobytes()])
+		for g in found:
+			for h in gens:
+				new = dot(h,g)
+				if new.tobytes() not in seen:
+					seen.add(new.tobytes())
+					found.append(new)
+		ops = array(found)
+		ops.setflags(write=False)		#shared between callers
+		with laue_lock:
+			laue_cache[laue] = ops
+	return(ops)
+
+def asymmetric_unit(cfg,H,K,L):		#mask picking one hkl out of each family
+	laue = laue_class[cfg.space_group]
+	if (laue=="m-3m"):
+		return((H>=K) & (K>=L) & (L>=0))
+	elif (laue=="6/mmm" or laue=="4/mmm"):
+		return((H>=K) & (K>=0) & (L>=0))
+	else:
+		return((H>=0) & (K>=0) & (L>=0))
+
+def multiplicity(cfg,H,K,L):	#how many hkl in each family pass rules()
+	ops = laue_ops(laue_class[cfg.space_group])
+	images = einsum('oij,jn->oin',ops,array([H,K,L]))	#every equivalent hkl, [op][hkl][reflection]
+	stabilizer = (images==array([H,K,L])).all(axis=1).sum(axis=0)	#ops that leave hkl alone
+	allowed = rules(cfg,images[:,0],images[:,1],images[:,2]).sum(axis=0)
+	return(allowed//stabilizer)
+
+# all of that only holds if every site is a whole orbit of the space group. a hand-typed
+# site (a distorted b4, half a c8, ...) doesn't have the full symmetry, its equivalent hkl
+# don't all have the same |F|, so those patterns are done with every hkl instead
+
+orbit_check_cache = OrderedDict()		#(space group, site) -> whole_orbit(), least recently used goes first
+orbit_check_cache_size = 1024
+
+def whole_orbit(space_group,site):	#does every operator of the group take the site into itself?
+	if not all([isscalar(v) for p in site[1:] for v in p]):
+		return(False)
+	key = (space_group,site_key(site))
+	with orbit_lock:
+		found = orbit_check_cache.get(key)
+		if found is not None:
+			orbit_check_cache.move_to_end(key)
+			return(found)
+	group,centering = group_operators(space_group)
+	P = array(site[1:],dtype=float).reshape(-1,3)
+	R = array([op[0] for op in group],dtype=float)
+	t = array([[float(v) for v in op[1]] for op in group])
+	C = array([(0,0,0)]+[[float(v) for v in c] for c in centering])
+	images = einsum('oij,nj->oni',R,P)+t[:,None,:]	#[op][atom][xyz]
+	diff = images[:,:,None,None,:]-P[None,None,:,None,:]-C[None,None,None,:,:]	#[op][atom][atom][centering][xyz]
+	found = bool((abs(diff-rint(diff))<1e-6).all(axis=-1).any(axis=(2,3)).all())
+	with orbit_lock:
+		orbit_check_cache[key] = found
+		if (len(orbit_check_cache)>orbit_check_cache_size):
+			orbit_check_cache.popitem(last=False)
+	return(found)
+
+def symmetry_settings(cfg,atoms):	#cfg, with SYMMETRY_REDUCE off if a site isn't a whole orbit
+	if (cfg.SYMMETRY_REDUCE and not all([whole_orbit(cfg.space_group,X[1]) for X in atoms])):
+		count(cfg,"symmetry_reduce_off")
+		return(cfg.replace(SYMMETRY_REDUCE=0))
+	return(cfg)
+
+# instrumentation. with cfg.instrument=1 each Pattern() call fills pattern_stats() with counts
+# (hkl enumerated, rejected by rules(), outside THETA_MIN/THETA_MAX, F_hkl and f worked
+# out, ...) and the wall time and peak memory of each stage. when a stage finishes, every
+# function in stage_hooks is called as hook(stage name, its numbers), from whichever thread
+# ran the stage. cfg.instrument_json (a file name) gets one JSON line per Pattern() call.
+# the numbers are kept per thread, so patterns worked out at the same time don't mix their
+# counts. peak memory comes from tracemalloc, which only sees the whole process, so it
+# includes the other threads when several are running
+
+instrument_local = threading.local()
+stage_hooks = []
+trace_lock = threading.Lock()
+instrument_lock = threading.Lock()
+trace_users = {"calls": 0, "started": False}	#Pattern() calls tracing memory, and whether they turned tracemalloc on
+
+def pattern_stats():	#{"counts": {...}, "stages": {...}} for this thread
+	if not hasattr(instrument_local,"stats"):
+		instrument_local.stats = {"counts": {}, "stages": {}}
+	return(instrument_local.stats)
+
+def reset_stats():		#fresh numbers for this thread
+	instrument_local.stats = {"counts": {}, "stages": {}}
+	return(instrument_local.stats)
+
+def trace_start():		#tracemalloc on while any Pattern() call wants it
+	with trace_lock:
+		if (trace_users["calls"]==0):
+			trace_users["started"] = not tracemalloc.is_tracing()
+			if (trace_users["started"]):
+				tracemalloc.start()
+		trace_users["calls"] += 1
+
+def trace_stop():
+	with trace_lock:
+		trace_users["calls"] -= 1
+		if (trace_users["calls"]==0 and trace_users["started"]):
+			tracemalloc.stop()
+
+def count(cfg,name,n=1):
+	if (cfg.instrument):
+		counts = pattern_stats()["counts"]
+		counts[name] = counts.get(name,0)+int(n)
+
+def stage_start(cfg):		#pass what this returns to stage_end
+	if (not cfg.instrument):
+		return(None)
+	if (tracemalloc.is_tracing()):
+		tracemalloc.reset_peak()
+		return((time.perf_counter(),tracemalloc.get_traced_memory()[0]))
+	return((time.perf_counter(),0))
+
+def stage_end(name,start):
+	if (start is None):
+		return
+	t = time.perf_counter()-start[0]
+	if (tracemalloc.is_tracing()):
+		peak = tracemalloc.get_traced_memory()[1]-start[1]	#above what was in use at the start
+	else:
+		peak = 0
+	stats = pattern_stats()
+	st = stats["stages"].setdefault(name,{"calls": 0, "time": 0.0, "peak_bytes": 0})
+	st["calls"] += 1
+	st["time"] += t
+	st["peak_bytes"] = int(maximum(st["peak_bytes"],peak))
+	for hook in stage_hooks:
+		hook(name,{"time": t, "peak_bytes": peak, "counts": dict(stats["counts"])})
+
+def stats_json():
+	return(json.dumps(pattern_stats(),indent=1))
+
+# reflection engine: every (h,k,l) at once as integer arrays instead of looping.
+# rules() and F_hkl() are applied as masks over the whole list, everything else
+# (d, 2theta, LP, G, f) is just numpy arithmetic on arrays
+
+def hkl_grid(cfg):		#all hkl in the box, same order as the old triple while loop
+	H,K,L = meshgrid(arange(-cfg.hmax,cfg.hmax+1),arange(-cfg.kmax,cfg.kmax+1),arange(-cfg.lmax,cfg.lmax+1),indexing='ij')
+	H,K,L = H.ravel(),K.ravel(),L.ravel()
+	nonzero = (H!=0) | (K!=0) | (L!=0)		#(000) is never a reflection
+	return(H[nonzero],K[nonzero],L[nonzero])
+
+def hkl_sphere(cfg,Lambda=None):	#only hkl inside the limiting sphere 1/d <= 2 sin(THETA_MAX/2)/Lambda
+	if (Lambda is None):
+		Lambda = cfg.Lambda
+	smax = 2.0*sin(radians(minimum(cfg.THETA_MAX,180.0)/2.0))/Lambda
+	a,b,c = axes(cfg)
+	hb,kb = int(smax*a+1e-9),int(smax*b+1e-9)	#|h| <= |a|/d, etc.
+	if (cfg.SYMMETRY_REDUCE):	#all the asymmetric units are in the +++ octant
+		H,K = meshgrid(arange(0,hb+1),arange(0,kb+1),indexing='ij')
+	else:
+		H,K = meshgrid(arange(-hb,hb+1),arange(-kb,kb+1),indexing='ij')
+	H,K = H.ravel(),K.ravel()
+	rest = smax*smax-inv_d2(cfg,H,K,0)		#what is left for l in each (h,k) row; c is normal to a,b here
+	H,K,rest = H[rest>=0],K[rest>=0],rest[rest>=0]
+	lb = (c*sqrt(rest)+1e-9).astype(int)
+	if (cfg.SYMMETRY_REDUCE):
+		lo = zeros(shape(lb),dtype=int)
+	else:
+		lo = -lb
+	n = lb-lo+1		#number of l in each row
+	H,K = repeat(H,n),repeat(K,n)
+	L = arange(n.sum())-repeat(cumsum(n)-n,n)+repeat(lo,n)
+	nonzero = (H!=0) | (K!=0) | (L!=0)		#(000) is never a reflection
+	return(H[nonzero],K[nonzero],L[nonzero])
+
+def amplitude(cfg,atoms,H,K,L,d):	#F_hkl for each site (x occupancy) and the total sum of F*f
+	t = stage_start(cfg)
+	F = [F_hkl(cfg,X[1],H,K,L)*X[2] for X in atoms]
+	stage_end("F_hkl",t)
+	t = stage_start(cfg)
+	A = 0
+	for X,FX in zip(atoms,F):
+		A = A + FX*f_shells(cfg,X[0],d)
+	stage_end("f",t)
+	return(F,A)
+
+def reflection_list(cfg,Lambda=None):	#allowed hkl between THETA_MIN and THETA_MAX, with multiplicity, d, 2theta
+	if (Lambda is None):
+		Lambda = cfg.Lambda
+	t = stage_start(cfg)
+	if (cfg.hmax>0):
+		H,K,L = hkl_grid(cfg)
+	else:
+		H,K,L = hkl_sphere(cfg,Lambda)
+	count(cfg,"hkl_enumerated",len(H))
+	stage_end("enumeration",t)
+	t = stage_start(cfg)
+	if (cfg.SYMMETRY_REDUCE):
+		au = asymmetric_unit(cfg,H,K,L)
+		count(cfg,"hkl_symmetry_equivalent",len(H)-au.sum())	#left out, counted in M instead
+		H,K,L = H[au],K[au],L[au]
+		M = multiplicity(cfg,H,K,L)
+		allowed = (M>0)
+	else:
+		M = ones(shape(H),dtype=int)
+		allowed = rules(cfg,H,K,L)
+	count(cfg,"rules_rejected",len(H)-allowed.sum())
+	H,K,L,M = H[allowed],K[allowed],L[allowed],M[allowed]
+	stage_end("rules",t)
+	t = stage_start(cfg)
+	d = d_hkl(cfg,H,K,L)
+	two_theta = bragg(d,Lambda)
+	inrange = (two_theta<cfg.THETA_MAX) & (two_theta>cfg.THETA_MIN)	#no point doing the rest for these
+	count(cfg,"outside_theta_range",len(H)-inrange.sum())
+	count(cfg,"reflections",inrange.sum())
+	stage_end("d/2theta",t)
+	return(H[inrange],K[inrange],L[inrange],M[inrange],d[inrange],two_theta[inrange])
+
+def Reflections(cfg,X1,X2,Y1,Y2,Z1,Z2):	#returns the sorted pattern list
+	H,K,L,M,d,two_theta = reflection_list(cfg)
+	if (lattice(cfg)=="hexagonal"):
+		I4 = -(H+K) 	#fourth hexagonal index
+	else:
+		I4 = zeros(shape(H),dtype=int)
+	#e.g. 50% occupied, scale accordingly
+	#X has X[element,site,occupancy]
+	(F_X1,F_Y1,F_Z1,F_X2,F_Y2,F_Z2),A = amplitude(cfg,[X1,Y1,Z1,X2,Y2,Z2],H,K,L,d)
+	t = stage_start(cfg)
+	LP = Lorentz_Pol(cfg,d,cfg.Lambda)
+	G = thickness(cfg,d,cfg.Lambda,film_mu(cfg,[X1,Y1,Z1,X2,Y2,Z2]))
+	I = G*LP*(absolute(A))**2
+	if (cfg.SYMMETRY_REDUCE):
+		if (cfg.space_group in acentric):	#half the family is -h-k-l, average the two
+			stage_end("LP/G",t)
+			Abar = amplitude(cfg,[X1,Y1,Z1,X2,Y2,Z2],-H,-K,-L,d)[1]
+			t = stage_start(cfg)
+			I = (I + G*LP*(absolute(Abar))**2)/2.0
+		I = M*I
+	stage_end("LP/G",t)
+	t = stage_start(cfg)
+	order = argsort(two_theta,kind='stable')	#sort list on 2-theta value
+	if (lattice(cfg)=="hexagonal"): #if hex, output hkil
+		columns = [two_theta,H,K,I4,L,F_X1,F_X2,F_Y1,F_Y2,F_Z1,F_Z2,I,d,M]
+	else: #if not hex, output hkl0
+		columns = [two_theta,H,K,L,I4,F_X1,F_X2,F_Y1,F_Y2,F_Z1,F_Z2,I,d,M]
+	pattern = [list(x) for x in zip(*[c[order].tolist() for c in columns])]
+	stage_end("sort",t)
+	return(pattern)
+
+# several wavelengths in one go: Ka1/Ka2/Kb of one tube, or Co and Cu together. the hkl list
+# and F_hkl of each site only depend on the structure, so they are done once (at the shortest
+# wavelength, which reaches the most hkl) and reused. per line only f (f', f'' of its tube),
+# 2theta, LP and G change. lines is a list of [tube, wavelength, weight], e.g.
+# tube_lines("Cu")+tube_lines("Co"). with AUTO_MU each line gets its own MU, otherwise they
+# all use cfg.MU. combine=0 gives one [peak 2theta, I, [hkl] in each peak] per line, merged
+# and scaled to max 100 like the peak list of Pattern() (the weights don't matter then),
+# combine=1 one weighted list of reflections sorted on 2theta, [two_theta, I, hkl, line]
+# with line the index into lines of each reflection
+
+def PatternLines(cfg,X1,X2,Y1,Y2,Z1,Z2,lines,combine=0):
+	atoms = [X1,Y1,Z1,X2,Y2,Z2]
+	cfg = symmetry_settings(cfg,atoms)
+	shortest = amin(array([line[1] for line in lines],dtype=float))
+	H,K,L,M,d,two_theta = reflection_list(cfg.replace(THETA_MIN=0),shortest)	#THETA_MIN is per line below
+	hkl = stack([H,K,L],axis=1)
+	t = stage_start(cfg)
+	F = [F_hkl(cfg,X[1],H,K,L)*X[2] for X in atoms]
+	if (cfg.SYMMETRY_REDUCE and cfg.space_group in acentric):	#-h-k-l half of each family
+		Fbar = [F_hkl(cfg,X[1],-H,-K,-L)*X[2] for X in atoms]
+	else:
+		Fbar = None
+	stage_end("F_hkl",t)
+	out = []
+	for n,(tube,Lambda,weight) in enumerate(lines):
+		line = cfg.replace(XRAY=tube)		#f', f'' of this tube
+		t = stage_start(cfg)
+		f_line = [f_shells(line,X[0],d) for X in atoms]
+		stage_end("f",t)
+		t = stage_start(cfg)
+		scale = M*thickness(cfg,d,Lambda,film_mu(line,atoms,Lambda))*Lorentz_Pol(cfg,d,Lambda)
+		A = 0
+		for FX,fX in zip(F,f_line):
+			A = A + FX*fX
+		I = scale*absolute(A)**2
+		if (Fbar is not None):
+			Abar = 0
+			for FX,fX in zip(Fbar,f_line):
+				Abar = Abar + FX*fX
+			I = (I + scale*absolute(Abar)**2)/2.0
+		tt = bragg(d,Lambda)
+		inrange = (tt<cfg.THETA_MAX) & (tt>cfg.THETA_MIN)
+		out.append([tt[inrange],weight*I[inrange],hkl[inrange],n*ones(inrange.sum(),dtype=int)])
+		stage_end("LP/G",t)
+	if (combine):
+		two_theta,I,hkl,which = [concatenate([o[i] for o in out]) for i in range(4)]
+		order = argsort(two_theta,kind='stable')
+		out = [[two_theta[order],I[order],hkl[order],which[order]]]
+	if (not combine):
+		merged = []
+		for tt,I,h,n in out:
+			order = argsort(tt,kind='stable')		#same order Reflections() adds them up in
+			if (lattice(cfg)=="hexagonal"):
+				h = stack([h[:,0],h[:,1],-(h[:,0]+h[:,1]),h[:,2]],axis=1)	#hkil, as Pattern() prints
+			merged.append(list(merge_reflections(cfg,tt[order],I[order],h[order].tolist())[:3]))
+		return(merged)
+	o = out[0]
+	if (len(o[1]) and o[1].max()>0):
+		o[1] = 100*o[1]/o[1].max()
+	return(o)
+
+# intensities of a few reflections over many x-ray energies in one go, e.g. (111), (200) and
+# (220) across the Fe and Co K edges to find where Fe/Co site ordering shows up best. F_hkl
+# and fo*DW don't depend on energy so they are done once, and then
+# A[energy][hkl] = sum_j F_j*fo_j*DW_j + sum_j (f'_j+if"_j)(E)*F_j*DW_j is one matrix product.
+# f', f" come from dispersion_at(), LP and G follow the wavelength (and so does MU, from f",
+# with AUTO_MU). hkl is a
+# list of [h,k,l], energies in keV. returns 2theta and I, both [energy][hkl]. I is on one scale
+# for the whole scan, so the columns can be divided by each other, and is 0 where lambda > 2d
+
+def EnergyScan(cfg,X1,X2,Y1,Y2,Z1,Z2,hkl,energies):
+	atoms = [X1,Y1,Z1,X2,Y2,Z2]
+	cfg = symmetry_settings(cfg,atoms)
+	H,K,L = array(hkl,dtype=int).reshape(-1,3).T
+	energies = asarray(energies,dtype=float)
+	for element in sorted(set([X[0] for X in atoms if X[0]!=Va])):
+		problem = dispersion_coverage(element,energies)
+		if (problem):
+			warnings.warn(problem,stacklevel=2)
+	d = d_hkl(cfg,H,K,L)
+	if (cfg.SYMMETRY_REDUCE):
+		M = multiplicity(cfg,H,K,L)
+	else:
+		M = rules(cfg,H,K,L).astype(int)
+	Z = array([X[0] for X in atoms])
+	fo = f(cfg.replace(DISPERSION=0),Z[:,None],d[None,:])		#[site][hkl], DW included
+	if (cfg.DEBYE_WALLER):
+		dw = exp(-element_data(cfg.element_cache_dir)[Z]["B"][:,None]/(2.0*d[None,:])**2)
+	else:
+		dw = ones(shape(fo))
+	fp,fpp = array([dispersion_at(X[0],energies) for X in atoms]).transpose(1,0,2)	#[site][energy]
+	if (cfg.DISPERSION):
+		disp = fp+1j*fpp
+	else:
+		disp = zeros((len(atoms),len(energies)))
+	Lambda = hc/energies[:,None]
+	MU = cfg.MU
+	if (cfg.AUTO_MU):		#sigma = 2 r_e lambda f" at each energy, as in absorption_mu()
+		n = array([site_count(cfg,X[1])*X[2] for X in atoms])
+		MU = 2.0*r_e*Lambda*1e-8*dot(n,fpp)[:,None]/(cell_volume(cfg)*1e-24)
+	scale = M*thickness(cfg,d[None,:],Lambda,MU)*Lorentz_Pol(cfg,d[None,:],Lambda)
+	F = array([F_hkl(cfg,X[1],H,K,L)*X[2] for X in atoms])
+	I = scale*absolute((F*fo).sum(axis=0)+dot(disp.T,F*dw))**2
+	if (cfg.SYMMETRY_REDUCE and cfg.space_group in acentric):	#average with -h-k-l, as in Reflections()
+		F = array([F_hkl(cfg,X[1],-H,-K,-L)*X[2] for X in atoms])
+		I = (I + scale*absolute((F*fo).sum(axis=0)+dot(disp.T,F*dw))**2)/2.0
+	return(bragg(d[None,:],Lambda),I)
+
+# specular thin film scan. a symmetric theta-2theta scan of an epitaxial film only sees the
+# reflections whose scattering vector is along the film normal, i.e. the rod n*(h0,k0,l0) of
+# the smallest hkl parallel to the growth direction [uvw], e.g. (00l) for [001]. only those
+# are worked out (tens instead of the whole sphere), each one on its own (M = 1, and no
+# -h-k-l averaging since that is a different reflection in a film). off_specular is a list
+# of other hkl to add, e.g. [[2,0,2],[1,1,1]] for phi scans/RSMs, with their tilt psi from
+# the normal and azimuth phi. orientation is the 3x3 rotation from the crystal cartesian
+# frame (cell_vectors) to the film frame, z = normal and x = some in-plane reference; without
+# it, z is [uvw] and x is along a (or as close as the normal allows). the thickness
+# correction uses the longer path at psi (G for d/cos(psi)); psi >= 90 can't be reached in
+# reflection and gets I = 0. returns rows [2theta, h, k, l, psi, phi, I] sorted on 2theta,
+# I scaled so the strongest specular peak is 100. an [uvw] with no lattice rod along it
+# (e.g. [110] in an orthorhombic cell) prints a warning and returns []
+
+def specular_hkl(cfg,normal):	#smallest integer hkl along the real space direction [uvw], None if there is none
+	vectors = cell_vectors(cfg)
+	h = dot(dot(vectors,vectors.T),asarray(normal,dtype=float))	#metric tensor, g.[uvw] is parallel to it in hkl
+	if (absolute(h).max()==0):
+		return(None)
+	h = h/absolute(h[absolute(h)>1e-9*absolute(h).max()]).min()
+	for n in range(1,25):
+		if allclose(h*n,rint(h*n),atol=1e-6):
+			hkl = rint(h*n).astype(int)
+			return(hkl//np.gcd.reduce(absolute(hkl)))
+	return(None)
+
+def film_frame(cfg,normal,orientation=None):	#(rod hkl, q = recip.hkl, crystal to film rotation), None if no rod
+	h0 = specular_hkl(cfg,normal)
+	if (h0 is None):
+		print("!!! no reciprocal lattice rod along [%s] in this cell"%(" ".join([str(u) for u in normal])))
+		return(None)
+	recip = np.linalg.inv(cell_vectors(cfg))		#columns are a*, b*, c*, so q = recip.hkl (1/angstrom)
+	if (orientation is None):
+		z = dot(recip,h0)
+		z = z/np.linalg.norm(z)
+		x = array([1.0,0,0])-z[0]*z	#a, minus its part along the normal
+		if (np.linalg.norm(x)<1e-6):
+			x = array([0,1.0,0])-z[1]*z
+		x = x/np.linalg.norm(x)
+		orientation = array([x,cross(z,x),z])
+	return(h0,recip,asarray(orientation,dtype=float))
+
+def SpecularRod(cfg,X1,X2,Y1,Y2,Z1,Z2,normal,off_specular=[],orientation=None):
+	atoms = [X1,Y1,Z1,X2,Y2,Z2]
+	frame = film_frame(cfg,normal,orientation)
+	if (frame is None):
+		return([])
+	h0,recip,orientation = frame
+	nmax = int(2.0*sin(radians(minimum(cfg.THETA_MAX,180.0)/2.0))/(cfg.Lambda*np.linalg.norm(dot(recip,h0)))+1e-9)
+	rod = arange(1,nmax+1)[:,None]*h0[None,:]
+	hkl = concatenate([rod,array(off_specular,dtype=int).reshape(-1,3)])
+	H,K,L = hkl.T
+	q = dot(orientation,dot(recip,hkl.T))		#film frame, [xyz][reflection]
+	d = 1.0/np.linalg.norm(q,axis=0)
+	psi = degrees(arccos(clip(q[2]*d,-1.0,1.0)))
+	phi = degrees(arctan2(q[1],q[0]))
+	psi[:len(rod)],phi[:len(rod)] = 0.0,0.0
+	A = amplitude(cfg,atoms,H,K,L,d)[1]
+	tilt = cos(radians(psi))
+	MU = film_mu(cfg,atoms)
+	I = Lorentz_Pol(cfg,d,cfg.Lambda)*thickness(cfg,d/where(tilt>0,tilt,1),cfg.Lambda,MU)*absolute(A)**2
+	allowed = rules(cfg,H,K,L)
+	I = where(allowed & (tilt>1e-9),I,0)
+	two_theta = bragg(d,cfg.Lambda)
+	keep = (two_theta>cfg.THETA_MIN) & (two_theta<cfg.THETA_MAX) & allowed
+	keep[len(rod):] = (two_theta[len(rod):]>0)		#asked for, so kept (even if forbidden) unless lambda > 2d
+	top = I[:len(rod)][keep[:len(rod)]].max() if keep[:len(rod)].any() else 0
+	I = 100*I/(top if top>0 else 1)
+	order = argsort(two_theta[keep],kind='stable')
+	columns = [two_theta,H,K,L,psi,phi,I]
+	return([list(x) for x in zip(*[c[keep][order].tolist() for c in columns])])
+
+# reciprocal space map around a few reflections of an epitaxial film, in the film frame of
+# film_frame() (z along the normal), q in 1/angstrom without the 2pi (q = 1/d as everywhere
+# here, x 2pi for Q). each reflection puts its integrated intensity G*LP*|F|^2 (from F_hkl
+# and f) into a peak shaped by
+#	the film thickness: Laue function sin^2(pi N d q)/sin^2(pi d q) along qz, N = THICKNESS/d
+#		layers of the rod spacing d, kept to half a period either side so it doesn't repeat
+#	the lateral coherence length rsm_coherence: gaussian in qx, qy of FWHM 1/rsm_coherence
+#	the mosaic spread rsm_mosaic: gaussian across q (perpendicular to it) of FWHM |q| x mosaic
+# the two gaussians are convolved (covariances add) and then with the Laue function, which
+# along qz is a 1D gaussian smearing done with Gauss-Hermite quadrature. qx, qz (and qy) are
+# the grid axes. without qy the map is in the xz plane of the film frame turned about z so
+# the first tilted reflection in hkl is at phi = 0, i.e. the plane of an asymmetric RSM, and
+# is integrated over qy (as a detector open out of the scattering plane would see it).
+# the grid is done in chunks of points of about rsm_mb MB each, so big 3D maps fit.
+# returns I [qx][qz] or [qx][qy][qz], max 100
+
+rsm_nodes,rsm_weights = np.polynomial.hermite.hermgauss(9)
+
+def rsm_frame(cfg,hkl,normal,orientation=None,inplane=0):	#(rod hkl, q of each hkl in the film frame [hkl][xyz]), None if no rod
+	frame = film_frame(cfg,normal,orientation)
+	if (frame is None):
+		return(None)
+	h0,recip,orientation = frame
+	q = dot(orientation,dot(recip,array(hkl,dtype=float).reshape(-1,3).T)).T
+	if (inplane):		#turn about z to put the first tilted one in the xz plane
+		tilted = hypot(q[:,0],q[:,1])>1e-9
+		if tilted.any():
+			phi = arctan2(q[tilted][0,1],q[tilted][0,0])
+			turn = array([[cos(phi),sin(phi),0],[-sin(phi),cos(phi),0],[0,0,1]])
+			q = dot(turn,q.T).T
+	return(h0,q)
+
+def RSM(cfg,X1,X2,Y1,Y2,Z1,Z2,hkl,normal,qx,qz,qy=None,orientation=None):
+	atoms = [X1,Y1,Z1,X2,Y2,Z2]
+	frame = rsm_frame(cfg,hkl,normal,orientation,qy is None)
+	if (frame is None):
+		return(None)
+	h0,q0 = frame
+	hkl = array(hkl,dtype=int).reshape(-1,3)
+	H,K,L = hkl.T
+	qlen = sqrt((q0*q0).sum(axis=1))
+	d = 1.0/qlen
+	tilt = q0[:,2]*d		#cos(psi)
+	A = amplitude(cfg,atoms,H,K,L,d)[1]
+	I0 = Lorentz_Pol(cfg,d,cfg.Lambda)*thickness(cfg,d/where(tilt>0,tilt,1),cfg.Lambda,film_mu(cfg,atoms))*absolute(A)**2
+	I0 = where(rules(cfg,H,K,L) & (tilt>1e-9),I0,0)
+	spacing = 1.0/np.linalg.norm(dot(np.linalg.inv(cell_vectors(cfg)),h0))	#d of the rod, the layer spacing
+	N = maximum(cfg.THICKNESS*1e8/spacing,1.0)
+	k = 1.0/(2.0*sqrt(2.0*log(2.0)))		#FWHM to sigma
+	qhat = q0/qlen[:,None]
+	sigma = (k/cfg.rsm_coherence)**2*diag([1.0,1.0,0])[None,:,:] \
+		+ (k*qlen*radians(cfg.rsm_mosaic))[:,None,None]**2*(eye(3)[None,:,:]-qhat[:,:,None]*qhat[:,None,:])
+	lateral = [0] if qy is None else [0,1]		#a 2D map is integrated over qy, like a detector open out of plane
+	sxy = sigma[:,lateral][:,:,lateral]
+	sxy_inv = np.linalg.inv(sxy)
+	lean = einsum('ni,nij->nj',sigma[:,2,lateral],sxy_inv)		#how qz of the gaussian follows qx, qy
+	s = sqrt(maximum(sigma[:,2,2]-einsum('ni,ni->n',lean,sigma[:,2,lateral]),0))	#qz spread left for the smearing
+	area = sqrt((2.0*pi)**len(lateral)*np.linalg.det(sxy))
+	qy = array([0.0]) if qy is None else asarray(qy,dtype=float)
+	qx,qz = asarray(qx,dtype=float),asarray(qz,dtype=float)
+	shape_out = (len(qx),len(qy),len(qz))
+	total = len(qx)*len(qy)*len(qz)
+	chunk = int(maximum(1,cfg.rsm_mb*2**20//(8*len(hkl)*(8+len(rsm_nodes)))))
+	I = zeros(total)
+	for start in range(0,total,chunk):
+		i,j,l = unravel_index(arange(start,minimum(start+chunk,total)),shape_out)
+		dq = [qx[i][:,None]-q0[None,:,0],qy[j][:,None]-q0[None,:,1]][:len(lateral)]	#[point][reflection]
+		dz = qz[l][:,None]-q0[None,:,2]
+		g = 0
+		mu = dz
+		for a in range(len(lateral)):
+			mu = mu-lean[:,a]*dq[a]
+			for b in range(len(lateral)):
+				g = g+sxy_inv[:,a,b]*dq[a]*dq[b]
+		g = exp(-0.5*g)/area
+		laue = 0
+		for x,w in zip(rsm_nodes,rsm_weights):
+			u = pi*spacing*(mu+sqrt(2.0)*s*x)
+			with errstate(invalid='ignore',divide='ignore'):
+				S = where(absolute(sin(u))>1e-12,sin(N*u)**2/sin(u)**2,N*N)
+			laue = laue + w/sqrt(pi)*where(absolute(u)<=pi/2.0,S,0)*spacing/N
+		I[start:start+len(dz)] = dot(g*laue,I0)
+	I = I.reshape(shape_out)
+	I = 100*I/(I.max() if I.max()>0 else 1)
+	if (shape_out[1]==1):
+		return(I[:,0,:])
+	return(I)
+
+# texture. an ideal powder has every orientation equally likely; a textured film or powder
+# has a pole density P_h(y) (times random, 1 = untextured) for the normal of each hkl plane
+# along each sample direction y, z = the sample normal. a symmetric scan only sees y = z, so
+# a reflection family gets the mean of P over its equivalent hkl (texture_factor()). textures:
+#	["march", r, hkl]	March-Dollase with plates (r < 1) or needles (r > 1) along the
+#		normal of the hkl planes, P(beta) = (r^2 cos^2 beta + sin^2 beta / r)^-3/2
+#	["fiber", FWHM, random, hkl]	gaussian fiber of that FWHM (degrees) around hkl along the
+#		normal, plus a random fraction
+#	["odf", rotations, weights, FWHM]	sampled ODF, [n][3][3] rotations from the crystal frame
+#		(cell_vectors) to the sample frame with their weights, each one smeared into a
+#		gaussian-like (von Mises-Fisher) pole of that FWHM
+# for the two fiber textures, a pole h at an angle alpha from the fiber hkl is spread over a
+# ring, so P_h(chi) is the average of P(beta) around it. the ODF is done as one batch of
+# [orientation][hkl][direction] arrays, in chunks of orientations of about texture_mb MB
+
+texture_ring = (arange(64)+0.5)*pi/64		#phi around the fiber for the ring average, midpoints
+
+def fiber_density(texture,beta):	#P(beta) of the fiber hkl at beta from the normal, mean 1 over the sphere
+	if (texture[0]=="march"):
+		r = float(texture[1])
+		return((r*r*cos(beta)**2+sin(beta)**2/r)**-1.5)
+	sigma = radians(texture[1])/(2.0*sqrt(2.0*log(2.0)))
+	b = (arange(2000)+0.5)*pi/4000
+	norm = (exp(-b*b/(2.0*sigma*sigma))*sin(b)).sum()*pi/4000		#mean of the gaussian over the (half) sphere
+	beta = minimum(beta,pi-beta)		#h and -h are the same pole
+	return(texture[2]+(1.0-texture[2])*exp(-beta*beta/(2.0*sigma*sigma))/norm)
+
+def unit_poles(cfg,hkl):	#plane normals of hkl [n][3] as unit vectors in the crystal frame
+	q = dot(np.linalg.inv(cell_vectors(cfg)),asarray(hkl,dtype=float).reshape(-1,3).T).T
+	return(q/sqrt((q*q).sum(axis=1))[:,None])
+
+def pole_density(cfg,texture,hkl,y):	#P_h(y) for each hkl [n][3] and sample direction y [m][3], [n][m]
+	h = unit_poles(cfg,hkl)
+	y = asarray(y,dtype=float).reshape(-1,3)
+	y = y/sqrt((y*y).sum(axis=1))[:,None]
+	if (texture[0]=="odf"):
+		R = asarray(texture[1],dtype=float).reshape(-1,3,3)
+		w = asarray(texture[2],dtype=float)
+		w = w/w.sum()
+		kappa = log(2.0)/(1.0-cos(radians(texture[3])/2.0))	#half the height at FWHM/2
+		P = zeros((len(h),len(y)))
+		chunk = int(maximum(1,cfg.texture_mb*2**20//(8*4*len(h)*len(y))))
+		for i in range(0,len(R),chunk):
+			t = einsum('gij,nj,mi->gnm',R[i:i+chunk],h,y,optimize=True)	#cos of the angle between each rotated pole and y
+			K = kappa*(exp(kappa*(t-1.0))+exp(-kappa*(t+1.0)))/(1.0-exp(-2.0*kappa))	#axial, mean 1 over the sphere
+			P = P + einsum('g,gnm->nm',w[i:i+chunk],K)
+		return(P)
+	axis = unit_poles(cfg,texture[-1])[0]
+	cos_alpha = clip(dot(h,axis),-1.0,1.0)		#[n]
+	cos_chi,back = unique(clip(y[:,2],-1.0,1.0),return_inverse=True)	#only the tilt matters, so each once
+	sin_alpha,sin_chi = sqrt(1.0-cos_alpha**2),sqrt(1.0-cos_chi**2)
+	cos_beta = cos_alpha[:,None,None]*cos_chi[None,:,None]+sin_alpha[:,None,None]*sin_chi[None,:,None]*cos(texture_ring)
+	P = fiber_density(texture,arccos(clip(cos_beta,-1.0,1.0))).mean(axis=2)
+	return(P[:,back.ravel()])
+
+def texture_factor(cfg,texture,H,K,L):	#mean P at the sample normal over each family (or each hkl without SYMMETRY_REDUCE)
+	if (not cfg.SYMMETRY_REDUCE):
+		return(pole_density(cfg,texture,stack([H,K,L],axis=1),[[0,0,1]])[:,0])
+	ops = laue_ops(laue_class[cfg.space_group])
+	images = einsum('oij,jn->oin',ops,array([H,K,L]))		#[op][hkl][reflection]
+	allowed = rules(cfg,images[:,0],images[:,1],images[:,2])
+	P = pole_density(cfg,texture,images.transpose(0,2,1).reshape(-1,3),[[0,0,1]]).reshape(allowed.shape)
+	return((P*allowed).sum(axis=0)/maximum(allowed.sum(axis=0),1))
+
+def PatternTexture(cfg,X1,X2,Y1,Y2,Z1,Z2,texture):	#Reflections() with I weighted by texture_factor()
+	cfg = symmetry_settings(cfg,[X1,X2,Y1,Y2,Z1,Z2])
+	pattern = Reflections(cfg,X1,X2,Y1,Y2,Z1,Z2)
+	if (len(pattern)==0):
+		return(pattern)
+	l = 4 if lattice(cfg)=="hexagonal" else 3		#hkil for hex
+	H,K,L = [array([x[i] for x in pattern],dtype=int) for i in (1,2,l)]
+	factor = texture_factor(cfg,texture,H,K,L)
+	for x,t in zip(pattern,factor.tolist()):
+		x[11] = x[11]*t
+	return(pattern)
+
+def PoleFigure(cfg,texture,hkl,chi,phi):	#P of the hkl family at tilt chi, azimuth phi (degrees), [chi][phi]
+	c,p = meshgrid(radians(asarray(chi,dtype=float)),radians(asarray(phi,dtype=float)),indexing='ij')
+	y = stack([sin(c)*cos(p),sin(c)*sin(p),cos(c)],axis=-1).reshape(-1,3)
+	ops = laue_ops(laue_class[cfg.space_group])
+	family = einsum('oij,j->oi',ops,array(hkl,dtype=int))
+	first = family[arange(len(family)),argmax(family!=0,axis=1)]
+	family = unique(family*where(first<0,-1,1)[:,None],axis=0)		#each equivalent once, h and -h are the same pole
+	return(pole_density(cfg,texture,family,y).mean(axis=0).reshape(c.shape))
+
+# many compositions at once. I = G*LP*|sum_j occ_j*F_j*f_j|^2 is linear in the occupancies
+# inside the modulus, so F_j*f_j for each of X1..Z2 (the basis) is done once and every
+# composition is one row of a single matrix product. elements and sites are taken from
+# X1..Z2 (their occupancies are ignored), occupancies is a list of [X1,X2,Y1,Y2,Z1,Z2]
+# rows. returns the peak positions and the normalized intensities, [composition][peak]
+
+def PatternBatch(cfg,X1,X2,Y1,Y2,Z1,Z2,occupancies):
+	cfg = symmetry_settings(cfg,[X1,X2,Y1,Y2,Z1,Z2])
+	H,K,L,M,d,two_theta = reflection_list(cfg)
+	pairs = [[X[0],X[1]] for X in [X1,X2,Y1,Y2,Z1,Z2]]
+	basis,basis_bar = site_basis(cfg,pairs,H,K,L,d)
+	absorb = batch_absorption(cfg,pairs,d)
+	scale = Lorentz_Pol(cfg,d,cfg.Lambda)*M
+	if (absorb is None):
+		scale = scale*thickness(cfg,d,cfg.Lambda)
+	peaks,index = peak_groups(cfg,two_theta)	#reflections in the same peak add up
+	return(peaks,batch_intensities(occupancies,basis,basis_bar,scale,index,len(peaks),absorb))
+
+def site_basis(cfg,pairs,H,K,L,d):	#F_hkl*f for each [element,site] pair, [pair][reflection]
+	basis = array([F_hkl(cfg,X[1],H,K,L)*f_shells(cfg,X[0],d) for X in pairs])
+	if (cfg.SYMMETRY_REDUCE and cfg.space_group in acentric):	#-h-k-l half of each family
+		basis_bar = array([F_hkl(cfg,X[1],-H,-K,-L)*f_shells(cfg,X[0],d) for X in pairs])
+	else:
+		basis_bar = None
+	return(basis,basis_bar)
+
+# with AUTO_MU every composition has its own MU, and so its own thickness correction G.
+# MU is linear in the occupancies too, so it is one more matrix product per chunk
+
+def batch_absorption(cfg,pairs,d):	#(MU per unit occupancy of each pair, 4 t d/lambda), None = G is in scale
+	if not (cfg.FILM and cfg.AUTO_MU):
+		return(None)
+	mu = absorption_mu(cfg,[[X[0],X[1],1.0] for X in pairs],occupancies=eye(len(pairs)))
+	return(mu,4.0*cfg.THICKNESS*asarray(d)/cfg.Lambda)
+
+def batch_intensities(occupancies,basis,basis_bar,scale,index,npeaks,absorb=None):	#normalized, [row][peak]
+	occ = atleast_2d(array(occupancies,dtype=float))
+	I = zeros((len(occ),npeaks))
+	for i in range(0,len(occ),1024):	#chunks of compositions to keep memory down
+		Ic = absolute(dot(occ[i:i+1024],basis))**2
+		if (basis_bar is not None):
+			Ic = (Ic + absolute(dot(occ[i:i+1024],basis_bar))**2)/2.0
+		if (absorb is not None):
+			Ic = Ic*(1.0-exp(-outer(dot(occ[i:i+1024],absorb[0]),absorb[1])))
+		add.at(I,(slice(i,i+len(Ic)),index),Ic*scale)
+	maxi = I.max(axis=1,keepdims=True)
+	return(100*I/where(maxi>0,maxi,1))
+
+# site assignment search. tries every way of putting the search elements on the search
+# sites, including disordered ones where a group of sites shares its atoms at random
+# (B2-like Y-Z mixing, DO3-like X-Y mixing, A2, ...), and ranks them against an observed
+# peak list. assignments related by a symmetry of the space group (e.g. swapping 4a and 4b
+# in SG225 is just an origin shift) give the same pattern, so only one of them is done.
+# elements are [element, atoms] with atoms counted over the listed positions of the sites,
+# e.g. for L21 Co2FeGe on a4/b4/c8: [[Co,2],[Fe,1],[Ge,1]]. empty positions are vacancies
+
+#site swaps (origin shifts, inversion) that leave the space group alone: "swaps" in space_groups
+def swap_group(cfg):	#all combinations of the site swaps for this space group
+	group = [{}]
+	for g in group:
+		for s in site_swaps[cfg.space_group]:
+			new = dict([(n,s.get(g.get(n,n),g.get(n,n))) for n in set(list(g)+list(s))])
+			new = dict([(a,b) for a,b in new.items() if a!=b])
+			if new not in group:
+				group.append(new)
+	return(group)
+
+def set_partitions(items):	#every way of splitting a list into groups
+	if (len(items)==0):
+		yield []
+		return
+	for rest in set_partitions(items[1:]):
+		yield [[items[0]]]+rest
+		for i in range(len(rest)):
+			yield rest[:i]+[[items[0]]+rest[i]]+rest[i+1:]
+
+def distribute(units,room):	#split each element's atoms over groups with room left in them
+	if (len(units)==0):
+		yield []
+		return
+	def split(n,i):
+		if (i==len(room)-1):
+			if (n<=room[i]):
+				yield [n]
+			return
+		for m in range(minimum(n,room[i]),-1,-1):
+			for rest in split(n-m,i+1):
+				yield [m]+rest
+	for first in split(units[0],0):
+		room = [r-m for r,m in zip(room,first)]
+		for rest in distribute(units[1:],room):
+			yield [first]+rest
+		room = [r+m for r,m in zip(room,first)]
+
+def site_assignments(cfg,search_elements,sites,step):	#{site name: ((element,occ),...)}, no repeats
+	cap = dict([(s[0],int(round((len(s)-1)/step))) for s in sites])	#positions in units of step
+	units = [int(round(n/step)) for e,n in search_elements]
+	positions = int(array(list(cap.values())).sum())
+	if (array(units).sum()>positions):
+		print("!!! more atoms than positions on the search sites")
+		return
+	units.append(positions-int(array(units).sum()))		#fill up with vacancies
+	elem = [e for e,n in search_elements]+[Va]
+	group = swap_group(cfg)
+	seen = set()
+	for blocks in set_partitions(list(cap)):
+		room = [int(array([cap[n] for n in b]).sum()) for b in blocks]
+		for split in distribute(units,room):
+			assign = {}
+			for j,b in enumerate(blocks):
+				mix = tuple(sorted([(elem[i],round(split[i][j]/float(room[j]),9)) for i in range(len(elem)) if split[i][j]>0]))
+				for n in b:
+					assign[n] = mix
+			key = sorted([tuple(sorted([(g.get(n,n),m) for n,m in assign.items()])) for g in group])[0]
+			if key not in seen:
+				seen.add(key)
+				yield assign
+
+def describe(assign):	#e.g. a4:Ge b4:Fe0.50Ge0.50 c8:Co
+	out = []
+	for n in sorted(assign):
+		mix = assign[n]
+		if (len(mix)==1):
+			out.append("%s:%s"%(n,elements[str(mix[0][0])]))
+		else:
+			out.append("%s:%s"%(n,"".join(["%s%.2f"%(elements[str(e)],o) for e,o in mix])))
+	return(" ".join(out))
+
+def read_peaks(filename):	#2theta, I pairs from a csv like our own peak-list output
+	peaks = []
+	for row in csv.reader(open(filename)):
+		try:
+			peaks.append([float(row[0]),float(row[1])])
+		except (ValueError,IndexError):
+			pass		#header lines
+	return(peaks)
+
+def agreement(peaks,I,observed,tol):	#R = sum|Io-Ic| / sum Io for each row of I[row][peak]
+	obs = array(observed,dtype=float)
+	gap = absolute(peaks[:,None]-obs[None,:,0])		#[calc peak][observed peak]
+	near = (gap<=tol) & (gap==gap.min(axis=1,keepdims=True))	#only counted for the closest observed peak
+	inrange = (peaks>=obs[:,0].min()-tol) & (peaks<=obs[:,0].max()+tol)
+	Ic = I*inrange
+	Ic = 100*Ic/where(Ic.max(axis=1,keepdims=True)>0,Ic.max(axis=1,keepdims=True),1)
+	Io = 100*obs[:,1]/obs[:,1].max()
+	matched = dot(Ic,near)		#calc intensity within tol of each observed peak
+	missing = dot(Ic,~near.any(axis=1))	#calc peaks nobody observed
+	return((absolute(matched-Io).sum(axis=1)+missing)/Io.sum())
+
+def score_assignments(occ,basis,basis_bar,scale,index,peaks,observed,tol,absorb=None):	#runs in the pool
+	return(agreement(peaks,batch_intensities(occ,basis,basis_bar,scale,index,len(peaks),absorb),observed,tol))
+
+def pool_chunks(cfg,job,rows,chunk,*args):	#(start, job(rows[start:start+chunk],*args)) as they finish
+	workers = cfg.search_workers or os.cpu_count()
+	methods = multiprocessing.get_all_start_methods()
+	if ("fork" in methods):		#workers inherit the setup
+		context = multiprocessing.get_context("fork")
+	else:		#job and args are pickled over to workers that import this module
+		context = multiprocessing.get_context("spawn")
+	pool = ProcessPoolExecutor(max_workers=workers,mp_context=context)
+	try:
+		futures = dict([(pool.submit(job,rows[i:i+chunk],*args),i) for i in range(0,len(rows),chunk)])
+		for j in as_completed(futures):
+			yield (futures[j],j.result())
+	finally:
+		pool.shutdown(wait=True,cancel_futures=True)
+
+def SearchSites(cfg,search_elements,sites,observed):
+	if (isinstance(observed,str)):
+		observed = read_peaks(observed)
+	Sites = wyckoff_sites(cfg)
+	sites = [getattr(Sites,s) if isinstance(s,str) else s for s in sites]	#names or the site lists
+	candidates = []
+	for assign in site_assignments(cfg,search_elements,sites,cfg.search_step):
+		candidates.append(assign)
+		if (len(candidates)>=cfg.search_max):
+			print("stopping at search_max=%d assignments"%(cfg.search_max))
+			break
+	print("%d distinct site assignments"%(len(candidates)))
+	site = dict([(s[0],s) for s in sites])
+	elem = sorted(set([e for a in candidates for n in a for e,o in a[n]]))
+	pairs = [[e,site[n]] for e in elem for n in sorted(site)]		#every element on every site
+	column = dict([((e,n),i) for i,(e,n) in enumerate([(e,n) for e in elem for n in sorted(site)])])
+	occ = zeros((len(candidates),len(pairs)))
+	for i,a in enumerate(candidates):
+		for n in a:
+			for e,o in a[n]:
+				occ[i,column[(e,n)]] = o
+	H,K,L,M,d,two_theta = reflection_list(cfg)
+	basis,basis_bar = site_basis(cfg,pairs,H,K,L,d)
+	absorb = batch_absorption(cfg,pairs,d)
+	scale = Lorentz_Pol(cfg,d,cfg.Lambda)*M
+	if (absorb is None):
+		scale = scale*thickness(cfg,d,cfg.Lambda)
+	peaks,index = peak_groups(cfg,two_theta)
+	R = full(len(candidates),inf)
+	for i,r in pool_chunks(cfg,score_assignments,occ,256,basis,basis_bar,scale,index,peaks,observed,cfg.search_tol,absorb):
+		R[i:i+len(r)] = r
+		print("%d/%d assignments, best R = %.4f"%(isfinite(R).sum(),len(candidates),R.min()))
+		if (R.min()<=cfg.search_cutoff):
+			print("found R <= search_cutoff=%s, stopping early"%(cfg.search_cutoff))
+			break
+	ranked = argsort(R,kind='stable')
+	print("\nbest site assignments (R = sum|Io-Ic|/sum Io)")
+	for i in ranked[:cfg.search_show]:
+		if isfinite(R[i]):
+			print("{0:8.4f}\t{1}".format(R[i],describe(candidates[i])))
+	return([(R[i],candidates[i]) for i in ranked if isfinite(R[i])])
+
+# internal coordinate search. the free x, y, z of the sites in free_sites() are set from a
+# grid of trial values and the pattern for every grid point is done in one go, with the
+# phase factors as [point][reflection] arrays, then scored against an observed peak list
+# like SearchSites. each round zooms in around the best point found so far.
+# params are [site name, 'x'/'y'/'z', from, to]. every atom on that site moves together,
+# coordinates that are not searched stay at cfg.x, y, z
+
+def xyz_grid(ranges,points):	#every combination of points values over each [from,to], [point][param]
+	values = [linspace(lo,hi,points) for lo,hi in ranges]
+	return(array(meshgrid(*values,indexing='ij')).reshape(len(ranges),-1).T)
+
+def xyz_amplitude(cfg,grid,params,atoms,f_atoms,H,K,L):	#sum of F*f*occ for the moving atoms, [point][reflection]
+	A = zeros((len(grid),len(H)),dtype=complex)
+	for X,fX in zip(atoms,f_atoms):
+		coord = {'x':cfg.x,'y':cfg.y,'z':cfg.z}
+		for j,(n,c,lo,hi) in enumerate(params):
+			if (n==X[1][0]):
+				coord[c] = grid[:,j][:,None]		#column, so it broadcasts against the hkl
+		site = wyckoff_orbit(cfg.space_group,X[1][0],coord['x'],coord['y'],coord['z'])
+		A = A + F_hkl(cfg,site,H,K,L)*X[2]*fX
+	return(A)
+
+def score_xyz(grid,cfg,params,atoms,f_atoms,A_fixed,A_fixed_bar,H,K,L,scale,index,peaks,observed,tol):	#runs in the pool
+	I = absolute(A_fixed+xyz_amplitude(cfg,grid,params,atoms,f_atoms,H,K,L))**2
+	if (A_fixed_bar is not None):
+		I = (I + absolute(A_fixed_bar+xyz_amplitude(cfg,grid,params,atoms,f_atoms,-H,-K,-L))**2)/2.0
+	Ip = zeros((len(grid),len(peaks)))
+	add.at(Ip,(slice(None),index),I*scale)
+	return(agreement(peaks,Ip,observed,tol))
+
+def SearchXYZ(cfg,X1,X2,Y1,Y2,Z1,Z2,params,observed):
+	if (isinstance(observed,str)):
+		observed = read_peaks(observed)
+	movable = free_sites(cfg.space_group)
+	for n,c,lo,hi in params:
+		if (n not in movable):
+			print("!!! site %s has no free x, y, z in %s"%(n,cfg.space_group))
+			return([])
+	names = [n for n,c,lo,hi in params]
+	atoms = [X for X in [X1,Y1,Z1,X2,Y2,Z2] if X[1][0] in names]
+	fixed = [X for X in [X1,Y1,Z1,X2,Y2,Z2] if X[1][0] not in names]
+	cfg = symmetry_settings(cfg,fixed)		#the moving ones are whole orbits from the table
+	H,K,L,M,d,two_theta = reflection_list(cfg)
+	A_fixed = amplitude(cfg,fixed,H,K,L,d)[1]		#atoms that don't move are only done once
+	if (cfg.SYMMETRY_REDUCE and cfg.space_group in acentric):
+		A_fixed_bar = amplitude(cfg,fixed,-H,-K,-L,d)[1]
+	else:
+		A_fixed_bar = None
+	f_atoms = [f_shells(cfg,X[0],d) for X in atoms]
+	scale = thickness(cfg,d,cfg.Lambda,film_mu(cfg,[X1,Y1,Z1,X2,Y2,Z2]))*Lorentz_Pol(cfg,d,cfg.Lambda)*M
+	peaks,index = peak_groups(cfg,two_theta)
+	ranges = [[lo,hi] for n,c,lo,hi in params]
+	points = cfg.search_xyz_points
+	tried = {}		#{point: R}, rounds overlap where they zoom in
+	for r in range(cfg.search_xyz_rounds):
+		grid = xyz_grid(ranges,points)
+		R = full(len(grid),inf)
+		for i,res in pool_chunks(cfg,score_xyz,grid,256,cfg,params,atoms,f_atoms,A_fixed,A_fixed_bar,H,K,L,scale,index,peaks,observed,cfg.search_tol):
+			R[i:i+len(res)] = res
+		tried.update(zip([tuple(p) for p in around(grid,9).tolist()],R))
+		best = grid[argmin(R)]
+		print("round %d: %d points, best R = %.4f at %s"%(r+1,len(grid),R.min()," ".join(["%s.%s=%.4f"%(p[0],p[1],v) for p,v in zip(params,best)])))
+		step = [(hi-lo)/(points-1.0) for lo,hi in ranges]
+		ranges = [[maximum(p[2],b-2*s),minimum(p[3],b+2*s)] for p,b,s in zip(params,best,step)]	#zoom in
+	tried = sorted([(R,point) for point,R in tried.items()],key=lambda t: t[0])
+	print("\nbest x, y, z (R = sum|Io-Ic|/sum Io)")
+	for R,point in tried[:cfg.search_show]:
+		print("{0:8.4f}\t{1}".format(R," ".join(["%s.%s=%.4f"%(p[0],p[1],v) for p,v in zip(params,point)])))
+	return([(R,dict([((p[0],p[1]),v) for p,v in zip(params,point)])) for R,point in tried])
+
+# continuous profile from the stick list, to overlay on a measured scan. each peak is a
+# pseudo-Voigt with Caglioti width FWHM^2 = U tan^2(theta) + V tan(theta) + W (degrees),
+# split into Ka1 and Ka2 (Ka2/Ka1 = profile_ka2 of the intensity). peaks are only worked
+# out within profile_window FWHM of their center, so the cost goes with the number of
+# peaks times the window and not the size of the grid. I can be one stick list or
+# [row][peak] like PatternBatch gives. returns the grid and the profile(s), max = 100
+
+def Profile(cfg,two_theta,I,grid=None):
+	two_theta = asarray(two_theta,dtype=float)
+	I = atleast_2d(asarray(I,dtype=float))
+	if (grid is None):
+		grid = arange(cfg.THETA_MIN,cfg.THETA_MAX+cfg.profile_step/2.0,cfg.profile_step)
+	grid = asarray(grid,dtype=float)
+	d = cfg.Lambda/(2.0*sin(radians(two_theta/2.0)))	#back to d so each line can be moved
+	ka2 = cfg.profile_ka2
+	if (ka2>0):
+		lines = [(bragg(d,cfg.Lambda1),1.0/(1.0+ka2)),(bragg(d,cfg.Lambda2),ka2/(1.0+ka2))]
+	else:
+		lines = [(two_theta,1.0)]
+	center = concatenate([t for t,w in lines])
+	weight = concatenate([w*ones(len(t)) for t,w in lines])
+	keep = center>0			#Ka2 can fall off the end past 180, bragg() gives 0 there
+	tan_theta = tan(radians(center[keep]/2.0))
+	width = sqrt(maximum(cfg.profile_U*tan_theta**2+cfg.profile_V*tan_theta+cfg.profile_W,1e-8))	#FWHM
+	center,weight = center[keep],weight[keep]
+	lo = searchsorted(grid,center-cfg.profile_window*width)
+	hi = searchsorted(grid,center+cfg.profile_window*width,side='right')
+	n = hi-lo			#grid points in each window
+	point = arange(n.sum())-repeat(cumsum(n)-n,n)+repeat(lo,n)
+	x = (grid[point]-repeat(center,n))/repeat(width,n)		#distance from center in FWHM
+	eta = cfg.profile_eta
+	shape = (eta*2.0/pi/(1.0+4.0*x*x) + (1.0-eta)*sqrt(4.0*log(2.0)/pi)*exp(-4.0*log(2.0)*x*x))/repeat(width,n)
+	y = zeros((len(I),len(grid)))
+	for r in range(len(I)):
+		area = concatenate([I[r]*w for t,w in lines])[keep]
+		y[r] = bincount(point,weights=shape*repeat(area,n),minlength=len(grid))
+	maxy = y.max(axis=1,keepdims=True)
+	y = 100*y/where(maxy>0,maxy,1)+cfg.profile_background
+	if (y.shape[0]==1):
+		y = y[0]
+	return(grid,y)
+
+# reflections into peaks. symmetry equivalent (or just overlapping) reflections don't land
+# on exactly the same float 2theta, so they are sorted and swept: a reflection within the
+# tolerance of the one before it joins its peak. the tolerance at each 2theta is the biggest
+# of merge_tol (degrees), merge_dtol (fraction of d) and merge_fwhm (fraction of the Caglioti
+# FWHM of the profile settings). each peak sits at the 2theta of its first reflection.
+# peak_groups() works on any list of 2theta, merged_peaks() on a Reflections() pattern
+
+def merge_tolerance(cfg,two_theta):	#2theta tolerance in degrees at each 2theta
+	tan_theta = tan(radians(asarray(two_theta,dtype=float)/2.0))
+	tol = maximum(cfg.merge_tol,degrees(2.0*tan_theta*cfg.merge_dtol))	#d(2theta) = 2 tan(theta) dd/d
+	if (cfg.merge_fwhm>0):
+		fwhm = sqrt(maximum(cfg.profile_U*tan_theta**2+cfg.profile_V*tan_theta+cfg.profile_W,0))
+		tol = maximum(tol,cfg.merge_fwhm*fwhm)
+	return(tol)
+
+def peak_groups(cfg,two_theta):	#(2theta of each peak, which peak each reflection is in)
+	two_theta = asarray(two_theta,dtype=float)
+	order = argsort(two_theta,kind='stable')
+	s = two_theta[order]
+	start = ones(len(s),dtype=bool)
+	start[1:] = diff(s)>merge_tolerance(cfg,s[1:])
+	index = zeros(len(s),dtype=int)
+	index[order] = cumsum(start)-1
+	return(s[start],index)
+
+def merge_reflections(cfg,two_theta,I,hkl):	#(peak 2theta, I scaled to the biggest = 100, [hkl] in each peak, max peak 2theta)
+	if (len(two_theta)==0):
+		return(zeros(0),zeros(0),[],0)
+	peaks,index = peak_groups(cfg,two_theta)
+	I = bincount(index,weights=I,minlength=len(peaks))	#adds up in the order given
+	families = [[] for p in peaks]
+	for i,x in zip(index.tolist(),hkl):
+		families[i].append(tuple(x))
+	top = len(I)-1-argmax(I[::-1])		#the last of equal biggest ones
+	maxi = I[top]
+	return(peaks,100*I/(maxi if maxi!=0 else 1),families,peaks[top])
+
+def merged_peaks(cfg,pattern):	#merge_reflections() of a Reflections() pattern
+	n = 5 if lattice(cfg)=="hexagonal" else 4		#hkil for hex
+	return(merge_reflections(cfg,[x[0] for x in pattern],[x[11] for x in pattern],[x[1:n] for x in pattern]))
+
+def peak_classes(cfg,families):	#F1-F4 class of each peak's hkl, e.g. "F3/F4 superlattice", "" outside heusler_groups
+	if (cfg.space_group not in heusler_groups):
+		return([""]*len(families))
+	labels = []
+	for hkl in families:
+		found = sorted(set([int(reflection_class(*x[:3])) for x in hkl]))
+		names = [class_names[c][0] for c in found if c>0]
+		kinds = sorted(set([class_names[c][1] for c in found]))
+		labels.append(" ".join(["/".join(names),"/".join(kinds)]).strip())
+	return(labels)
+
+def normalized_peaks(pattern,cfg=None):	#sum up reflections in the same peak, scale to the biggest = 100
+	peaks,I,families,maxtheta = merged_peaks(cfg or settings(),pattern)
+	pattern_dict2 = dict(zip(peaks.tolist(),I.tolist()))	#{2theta: I}
+	return(pattern_dict2,float(maxtheta))
+
+# on-disk cache of Pattern() results, so the same structure under the same conditions is
+# only ever worked out once. the key is a hash of everything that goes into the pattern
+# (space group, lattice, elements with their f data, sites, occupancies, wavelength,
+# corrections, angle range). each entry is a compressed .npz in pattern_cache_dir, and
+# the least recently used ones are deleted once the directory is over pattern_cache_mb
+
+pattern_cache_version = 3		#bump if the calculation changes, so old entries are ignored
+
+def pattern_key(cfg,X1,X2,Y1,Y2,Z1,Z2):
+	table = element_data(cfg.element_cache_dir)
+	atoms = [[X[0],table[X[0]].tolist(),X[1],float(X[2])] for X in [X1,X2,Y1,Y2,Z1,Z2]]
+	config = [pattern_cache_version,cfg.space_group,cfg.A,cfg.B,cfg.C,atoms,cfg.XRAY,cfg.Lambda,cfg.DISPERSION,cfg.DEBYE_WALLER,
+		cfg.SAMPLE_TYPE,cfg.FILM,cfg.THICKNESS,cfg.MU,cfg.AUTO_MU,cfg.THETA_MIN,cfg.THETA_MAX,cfg.hmax,cfg.kmax,cfg.lmax,cfg.SYMMETRY_REDUCE,
+		cfg.merge_tol,cfg.merge_dtol,cfg.merge_fwhm,cfg.profile_U,cfg.profile_V,cfg.profile_W]
+	return(hashlib.sha256(repr(config).encode()).hexdigest())
+
+def cache_load(cfg,key):		#(pattern, normalized peak dict, max peak 2theta) or None
+	if (not cfg.pattern_cache):
+		return(None)
+	name = os.path.join(cfg.pattern_cache_dir,key+".npz")
+	try:
+		with np.load(name) as data:
+			ints,F,reals,peaks,maxtheta = data['ints'],data['F'],data['reals'],data['peaks'],float(data['maxtheta'])
+		os.utime(name)		#mark as recently used
+	except (OSError,KeyError,ValueError):
+		return(None)
+	pattern = [[r[0]]+i[:4]+f+[r[1],r[2],i[4]] for i,f,r in zip(ints.tolist(),F.tolist(),reals.tolist())]
+	return(pattern,dict(peaks.tolist()),maxtheta)
+
+def cache_save(cfg,key,pattern,pattern_dict2,maxtheta):
+	if (not cfg.pattern_cache):
+		return
+	cache_dir = cfg.pattern_cache_dir
+	os.makedirs(cache_dir,exist_ok=True)
+	rows = len(pattern)
+	ints = array([[x[1],x[2],x[3],x[4],x[13]] for x in pattern],dtype=int).reshape(rows,5)	#hkl(i), M
+	F = array([x[5:11] for x in pattern],dtype=complex).reshape(rows,6)
+	reals = array([[x[0],x[11],x[12]] for x in pattern],dtype=float).reshape(rows,3)	#2theta, I, d
+	peaks = array(list(pattern_dict2.items()),dtype=float).reshape(-1,2)
+	name = os.path.join(cache_dir,key+".npz")
+	tmp = "%s.%d.%d.tmp.npz"%(name,os.getpid(),threading.get_ident())	#own temp file per writer
+	np.savez_compressed(tmp,ints=ints,F=F,reals=reals,peaks=peaks,maxtheta=maxtheta)
+	os.replace(tmp,name)		#so a reader never sees half a file
+	entries = []
+	for n in os.listdir(cache_dir):
+		n = os.path.join(cache_dir,n)
+		try:
+			if (n.endswith(".npz") and not n.endswith(".tmp.npz")):
+				entries.append((os.path.getmtime(n),os.path.getsize(n),n))
+		except OSError:
+			pass		#another writer evicted it meanwhile
+	entries = sorted(entries)
+	total = array([e[1] for e in entries]).sum()
+	for t,size,n in entries:		#oldest first
+		if (total<=cfg.pattern_cache_mb*1e6 or n==name):
+			break
+		try:
+			os.remove(n)
+		except OSError:
+			pass
+		total -= size
+
+def output_name(cfg,X1,X2,Y1,Y2,Z1,Z2,suffix):	#e.g. ./output/Coc8Coc8Fea4Fea4Geb4Geb4peak-list.csv
+	return(cfg.output_dir+"/"+elements[str(X1[0])]+X1[1][0]+elements[str(X2[0])]+X2[1][0]+elements[str(Y1[0])]+Y1[1][0]+elements[str(Y2[0])]+Y2[1][0]+elements[str(Z1[0])]+Z1[1][0]+elements[str(Z2[0])]+Z2[1][0]+suffix)
+
+def write_reflections(cfg,X1,X2,Y1,Y2,Z1,Z2,pattern):	#the full reflection table, with F for each site
+	OutFile = output_name(cfg,X1,X2,Y1,Y2,Z1,Z2,"scattering-factors-hkil"+".csv")
+	space_group = cfg.space_group
+	of = open(OutFile, 'wt')
+	DataOut=csv.writer(of)
+	DataOut.writerow([space_group])
+	DataOut.writerow(["a (A) lattice parameter"]+[cfg.A])
+	if ("B" in lattices[lattice(cfg)]):
+		DataOut.writerow(["b (A) lattice parameter"]+[cfg.B])
+	if ("C" in lattices[lattice(cfg)]):
+		DataOut.writerow(["c (A) lattice parameter"]+[cfg.C])
+	DataOut.writerow(["Elements"])
+	DataOut.writerow(["X1 X2 Y1 Y2 Z1 Z2 = "]+[(elements[str(X1[0])],elements[str(X2[0])],elements[str(Y1[0])],elements[str(Y2[0])],elements[str(Z1[0])],elements[str(Z2[0])])])
+	DataOut.writerow(["Sites"])
+	DataOut.writerow(["X1 X2 Y1 Y2 Z1 Z2 = "]+[X1[1][0],X2[1][0],Y1[1][0],Y2[1][0],Z1[1][0],Z2[1][0]])
+	DataOut.writerow(["Occupancy"])
+	DataOut.writerow(["X1 X2 Y1 Y2 Z1 Z2 = "]+[X1[2],X2[2],Y1[2],Y2[2],Z1[2],Z2[2]])
+
+	if (lattice(cfg)=="hexagonal"):
+		DataOut.writerow(['2T','h','k','i','l','Fx1','Fy1','Fz1','Fx2','Fy2','Fz2','I','d','M'])
+	else:
+		DataOut.writerow(['2T','h','k','l',' ','Fx1','Fy1','Fz1','Fx2','Fy2','Fz2','I','d','M'])
+	DataOut.writerows(pattern)
+	of.close()
+
+def write_peak_list(cfg,X1,X2,Y1,Y2,Z1,Z2,pattern_dict2):	#normalized 2theta, I
+	OutFile = output_name(cfg,X1,X2,Y1,Y2,Z1,Z2,"peak-list"+".csv")
+	of = open(OutFile, 'wt')
+	DataOut=csv.writer(of)
+	DataOut.writerow(['2T','I (norm.)'])
+	for key,value in sorted(pattern_dict2.items()):
+		if value!=0:
+			DataOut.writerow([key, value])
+	of.close()
+
+def write_energy_scan(cfg,X1,X2,Y1,Y2,Z1,Z2,hkl,energies,I):	#I of each hkl vs energy, and ratios to the last hkl
+	OutFile = output_name(cfg,X1,X2,Y1,Y2,Z1,Z2,"energy-scan"+".csv")
+	names = ["%d%d%d"%tuple(x) for x in hkl]
+	ratio = I[:,:-1]/where(I[:,-1:]>0,I[:,-1:],inf)
+	of = open(OutFile, 'wt')
+	DataOut=csv.writer(of)
+	DataOut.writerow(['E (keV)']+['I '+n for n in names]+['I %s/I %s'%(n,names[-1]) for n in names[:-1]])
+	DataOut.writerows(concatenate([energies[:,None],I,ratio],axis=1).tolist())
+	of.close()
+
+def write_rsm(cfg,X1,X2,Y1,Y2,Z1,Z2,hkl,qx,qz,I,qy=None):	#the map and its axes, for np.load
+	OutFile = output_name(cfg,X1,X2,Y1,Y2,Z1,Z2,"rsm"+".npz")
+	np.savez(OutFile,qx=qx,qy=(array([0.0]) if qy is None else qy),qz=qz,I=I,hkl=array(hkl))
+	return(OutFile)
+
+def write_pole_figure(cfg,X1,X2,Y1,Y2,Z1,Z2,hkl,chi,phi,P):	#pole density [chi][phi] and its axes, for np.load
+	OutFile = output_name(cfg,X1,X2,Y1,Y2,Z1,Z2,"pole-figure-%d%d%d"%tuple(hkl)+".npz")
+	np.savez(OutFile,chi=chi,phi=phi,P=P,hkl=array(hkl))
+	return(OutFile)
+
+def plot_pattern(cfg,x,y,px,py):	#bars (and the profile) on the current matplotlib figure
+	import matplotlib.pyplot as plt		#only now, so using the rest never loads matplotlib
+	plt.bar(x,y,width=0.2,color='b',edgecolor='b')
+	if (cfg.profile):
+		plt.plot(px,py,color='r',linewidth=0.5)
+	if (cfg.plotsqrt):
+		plt.axis([cfg.THETA_MIN, cfg.THETA_MAX, 0, 10])
+		plt.ylabel(r'$\sqrt{I}$'' (a.u.)')
+	else:
+		plt.axis([cfg.THETA_MIN, cfg.THETA_MAX, 0, 100])
+		plt.ylabel('I (a.u.)')
+	plt.xlabel(r'$2\theta\,(^\circ)$')
+	return(plt)
+
+#find all the peaks. with SYMMETRY_REDUCE each hkl family is listed once with its
+#multiplicity M (last column); otherwise we brute force all combos and M=1
+
+def pattern_data(cfg,X1,X2,Y1,Y2,Z1,Z2):	#(pattern, normalized peak dict, max peak 2theta), from the cache if it is there
+	cfg = symmetry_settings(cfg,[X1,X2,Y1,Y2,Z1,Z2])
+	t = stage_start(cfg)
+	key = pattern_key(cfg,X1,X2,Y1,Y2,Z1,Z2)
+	cached = cache_load(cfg,key)
+	stage_end("cache",t)
+	if (cached is not None):
+		count(cfg,"cache_hits")
+		return(cached)
+	pattern = Reflections(cfg,X1,X2,Y1,Y2,Z1,Z2)
+	t = stage_start(cfg)
+	pattern_dict2,maxtheta = normalized_peaks(pattern,cfg)
+	stage_end("normalize",t)
+	t = stage_start(cfg)
+	cache_save(cfg,key,pattern,pattern_dict2,maxtheta)
+	stage_end("cache",t)
+	return(pattern,pattern_dict2,maxtheta)
+
+# many structures at once on a thread pool, for a long-running process that gets asked
+# for lots of patterns. each job is [cfg,X1,X2,Y1,Y2,Z1,Z2] with its own settings (space
+# group, lattice, ...), nothing is shared between them but the f and disk caches. the
+# heavy parts are numpy, which lets go of the GIL, so threads do run side by side.
+# returns pattern_data() for each job, in order
+
+def PatternThreads(jobs,workers=0):
+	with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+		return(list(pool.map(lambda job: pattern_data(*job),jobs)))
+
+def Pattern(cfg,X1,X2,Y1,Y2,Z1,Z2,plot,outputfile,outputsites):
+	space_group = cfg.space_group
+	if (cfg.instrument):		#fresh numbers for this call
+		stats = reset_stats()
+		start = time.perf_counter()
+		trace_start()
+	try:
+		pattern,pattern_dict2,maxtheta = pattern_data(cfg,X1,X2,Y1,Y2,Z1,Z2)
+
+		t = stage_start(cfg)
+		if (outputfile):
+			write_reflections(cfg,X1,X2,Y1,Y2,Z1,Z2,pattern)
+
+		if (cfg.outputlistverbose):
+			print("data for all allowed (hkl)")
+			if (lattice(cfg)=="hexagonal"):
+				print("\n\n2Theta \t hkil \t X1 \t X2 \t Y1 \t Y2 \t Z1 \t Z2 \t I \t d (A) \t M")
+				for x in pattern:
+					if x[11]!=0:
+						print('{0:8.2f}\t ({1:1d},{2:1d},{3:1d},{4:1d}) \t {5:6.2f} \t {6:6.2f}  \t {7:8.2f} \t {8:6.2f} \t {9:6.2f}  \t {10:8.2f} \t {11}  \t {12:8.3f} \t {13:d} '.format(x[0], x[1], x[2], x[3], x[4], x[5], x[6], x[7], x[8], x[9],x[10],x[11],x[12],x[13]))
+			else:
+				print("\n\n2Theta \t hkl \t X1 \t X2 \t Y1 \t Y2 \t Z1 \t Z2 \t I \t d (A) \t M")
+				for x in pattern:
+					if x[11]!=0:
+						print('{0:8.2f}\t ({1:1d},{2:1d},{3:1d}) \t {4:6.2f} \t {5:6.2f}  \t {6:8.2f} \t {7:6.2f} \t {8:6.2f}  \t {9:8.2f} \t {10}  \t {11:8.3f} \t {12:d} '.format(x[0], x[1], x[2], x[3], x[5], x[6], x[7], x[8], x[9],x[10],x[11],x[12],x[13]))
+
+		if (cfg.outputlist):
+			print('\n2Theta \t I (normalized) \t hkl'+(' \t class' if space_group in heusler_groups else ''))      #prints the results
+			peaks,I,families,maxt = merged_peaks(cfg,pattern)
+			labels = dict(zip(peaks.tolist(),peak_classes(cfg,families)))
+			families = dict(zip(peaks.tolist(),families))	#same keys as pattern_dict2
+			for key,value in sorted(pattern_dict2.items()):
+				if value!=0:
+					hkl = " ".join(["("+",".join([str(h) for h in x])+")" for x in families.get(key,[])])
+					print(('{0:8.2f}\t{1:>10.6f}\t{2}'+('\t{3}' if labels.get(key) else '')).format(key,value,hkl,labels.get(key)))
+
+		if (outputfile):
+			write_peak_list(cfg,X1,X2,Y1,Y2,Z1,Z2,pattern_dict2)
+
+		px,py = None,None
+		if (cfg.profile):							#peak shapes on a 2theta grid, as a .xy file
+			px,py = Profile(cfg,list(pattern_dict2.keys()),list(pattern_dict2.values()))
+			if (outputfile):
+				savetxt(output_name(cfg,X1,X2,Y1,Y2,Z1,Z2,"profile"+".xy"),column_stack([px,py]),fmt='%.5f')
+			if (cfg.plotsqrt):
+				py = sqrt(py)
+
+		if (outputsites):
+			print("\n%s structure"%(space_group))
+			print("Elements X1=%s X2=%s Y1=%s Y2=%s Z1=%s Z2=%s"%(elements[str(X1[0])],elements[str(X2[0])],elements[str(Y1[0])],elements[str(Y2[0])],elements[str(Z1[0])],elements[str(Z2[0])]))
+			print("Sites X1=%s X2=%s Y1=%s Y2=%s Z1=%s Z2=%s \nOccupancy X1=%s X2=%s Y1=%s Y2=%s Z1=%s Z2=%s \n "%(X1[1][0],X2[1][0],Y1[1][0],Y2[1][0],Z1[1][0],Z2[1][0],X1[2],X2[2],Y1[2],Y2[2],Z1[2],Z2[2]))
+			if (cfg.FILM and cfg.AUTO_MU):
+				print("mu = %.0f 1/cm from the composition"%(absorption_mu(cfg,[X1,Y1,Z1,X2,Y2,Z2])))
+			print("Max peak at %f\n"%maxtheta)
+
+		stage_end("output",t)
+
+		t = stage_start(cfg)
+		if (plot or cfg.plotfile):					#prepare data to plot
+			x = []
+			y = []
+			for key,value in sorted(pattern_dict2.items()):
+				x.append(key)
+				if (cfg.plotsqrt):
+					y.append(sqrt(value))
+				else:
+					y.append(value)
+
+		if (plot):									#popup plot
+			plot_pattern(cfg,x,y,px,py).show()
+		if (cfg.plotfile):							#just dump a PNG
+			plot_pattern(cfg,x,y,px,py).savefig(output_name(cfg,X1,X2,Y1,Y2,Z1,Z2,"graph"+".png"), dpi = 600)
+		stage_end("plot",t)
+	finally:
+		if (cfg.instrument):		#also when something above raised, so tracemalloc doesn't stay on
+			trace_stop()
+
+	if (cfg.instrument):
+		stats["total_time"] = time.perf_counter()-start
+		print("\nstage \t\t time (s) \t peak (MB)")
+		for name,st in stats["stages"].items():
+			print("{0:14s}\t{1:9.5f}\t{2:9.3f}".format(name,st["time"],st["peak_bytes"]/1e6))
+		print("total \t\t{0:9.5f}".format(stats["total_time"]))
+		print(" ".join(["%s=%d"%(n,c) for n,c in stats["counts"].items()]))
+		if (cfg.instrument_json):
+			with instrument_lock:		#one whole line per call, whichever thread finishes first
+				with open(cfg.instrument_json,'a') as fh:
+					fh.write(json.dumps(stats)+"\n")
+	return(maxtheta)